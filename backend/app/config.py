@@ -1,5 +1,6 @@
+from functools import cached_property
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import List, Literal, Optional
 
 class Settings(BaseSettings):
     database_url: str
@@ -7,11 +8,40 @@ class Settings(BaseSettings):
     upload_dir: str = "uploads"
     max_file_size: int = 10485760  # 10MB in bytes
 
+    # Create missing tables on startup (set RUN_CREATE_ALL=1 for local development)
+    run_create_all: bool = False
+
     # AI API Keys (for cloud deployment)
     huggingface_api_key: Optional[str] = None
     groq_api_key: Optional[str] = None
     cohere_api_key: Optional[str] = None
 
+    # Worker threads available to sync (def) endpoints (anyio default is 40)
+    threadpool_limit: int = 200
+
+    # Max users processed concurrently by the weekly job digest
+    digest_concurrency: int = 8
+
+    # Max embedding requests in flight at once (tune to the provider's rate limit)
+    embedding_max_inflight: int = 8
+
+    # Where embeddings are computed: the Cohere API, or an in-process ONNX model
+    # (a 768-dimension BGE-style export: model.onnx + tokenizer.json in local_embedding_model_dir).
+    # Vectors from different backends aren't comparable; re-embed all documents after switching.
+    embedding_backend: Literal["cohere", "onnx"] = "cohere"
+    local_embedding_model_dir: Optional[str] = None
+
+    # Max tokens of retrieved document text sent to the LLM per RAG query
+    rag_context_tokens: int = 8000
+
+    # Level for application logs (DEBUG shows per-request detail)
+    log_level: str = "INFO"
+
+    @cached_property
+    def cors_origin_list(self) -> List[str]:
+        """CORS origins split from the comma-separated setting, trimmed and lowercased once"""
+        return [origin.strip().lower() for origin in self.cors_origins.split(",") if origin.strip()]
+
     class Config:
         env_file = ".env"
 
@@ -1,11 +1,31 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from pgvector.asyncpg import register_vector
 from .config import settings
 
 engine = create_engine(settings.database_url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine (asyncpg) for the hot read paths (RAG search, stats), so queries don't
+# block the event loop. asyncpg takes ssl as a connect argument rather than sslmode.
+_async_url = make_url(settings.database_url)
+_ssl_mode = _async_url.query.get("sslmode")
+async_engine = create_async_engine(
+    _async_url.set(drivername="postgresql+asyncpg").difference_update_query(["sslmode"]),
+    pool_size=20,
+    connect_args={"ssl": _ssl_mode} if _ssl_mode else {}
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+
+@event.listens_for(async_engine.sync_engine, "connect")
+def _register_vector_codec(dbapi_connection, connection_record):
+    # Vectors are sent and received as binary numpy arrays instead of text literals
+    dbapi_connection.run_async(register_vector)
+
 Base = declarative_base()
 
 def get_db():
@@ -14,3 +34,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
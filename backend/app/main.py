@@ -1,25 +1,49 @@
+from anyio import to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pathlib import Path
 from .config import settings
-from .database import engine, Base
+from .database import engine, async_engine, Base
+from .logging_config import setup_logging, shutdown_logging
+from .services.ai import close_http_client, start_tokenizer_load
+from .services.pdf_extractor import shutdown_pdf_pool
 from .routers import auth_router, users_router, documents_router, rag_router, jobs_router
 
-Base.metadata.create_all(bind=engine)
+# Creating tables costs a round-trip per table on every worker boot, so it only
+# runs when explicitly enabled (local development / first deploy)
+if settings.run_create_all:
+    Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="PDF Manager API", version="1.0.0")
+# orjson serializes large responses (job matches, document lists) much faster than stdlib json
+app = FastAPI(title="PDF Manager API", version="1.0.0", default_response_class=ORJSONResponse)
 
-# Create uploads directory on startup
+# Start logging and the tokenizer load, create uploads directory and size the threadpool on startup
 @app.on_event("startup")
 async def startup_event():
+    setup_logging()
+
+    # Token counting falls back to a length estimate until this finishes
+    start_tokenizer_load()
+
     upload_dir = Path(settings.upload_dir)
     upload_dir.mkdir(parents=True, exist_ok=True)
 
-origins = settings.cors_origins.split(",")
+    # Sync endpoints run in anyio's threadpool; raise its limit so blocking
+    # DB calls don't queue behind the default 40 threads under load
+    to_thread.current_default_thread_limiter().total_tokens = settings.threadpool_limit
+
+# Close pooled connections, stop PDF workers and flush logs on shutdown
+@app.on_event("shutdown")
+async def shutdown_event():
+    await close_http_client()
+    await async_engine.dispose()
+    shutdown_pdf_pool()
+    shutdown_logging()
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=origins,
+    allow_origins=settings.cors_origin_list,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -45,8 +69,8 @@ def debug_config():
     from .services.ai import COHERE_API_KEY, GROQ_API_KEY, EMBEDDING_MODEL
 
     return {
-        "embedding_provider": "Cohere",
-        "embedding_model": EMBEDDING_MODEL,
+        "embedding_provider": "Cohere" if settings.embedding_backend == "cohere" else "Local ONNX",
+        "embedding_model": EMBEDDING_MODEL if settings.embedding_backend == "cohere" else settings.local_embedding_model_dir,
         "cohere_api_key_set": bool(COHERE_API_KEY),
         "cohere_api_key_preview": f"{COHERE_API_KEY[:8]}...{COHERE_API_KEY[-4:]}" if COHERE_API_KEY else None,
         "groq_api_key_set": bool(GROQ_API_KEY),
@@ -65,7 +89,7 @@ async def test_embedding():
         return {
             "success": True,
             "dimensions": len(embedding),
-            "first_5_values": embedding[:5],
+            "first_5_values": embedding[:5].tolist(),
             "message": "Embedding generation successful!"
         }
     except Exception as e:
@@ -1,4 +1,5 @@
 from .user import User
 from .document import Document
+from .document_chunk import DocumentChunk
 
-__all__ = ["User", "Document"]
+__all__ = ["User", "Document", "DocumentChunk"]
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Integer
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Integer, LargeBinary, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -18,8 +18,27 @@ class Document(Base):
     title = Column(String(500), nullable=True)
     content = Column(Text, nullable=True)
     embedding = Column(Vector(768), nullable=True)
+    content_hash = Column(LargeBinary(16), nullable=True)  # BLAKE2b digest of the uploaded file
     status = Column(String(50), nullable=False, default="pending", index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
 
     user = relationship("User", back_populates="documents")
+    # Rows are removed by the ON DELETE CASCADE foreign key
+    chunks = relationship("DocumentChunk", back_populates="document", cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        # Latest embedded document per user (weekly job digest)
+        Index(
+            "documents_embedding_notnull_idx",
+            user_id,
+            created_at.desc(),
+            postgresql_where=embedding.isnot(None),
+        ),
+        # Per-user document list, newest first
+        Index("documents_user_created_idx", user_id, created_at.desc()),
+        # Covers the per-user stats aggregation (counts by status and recency)
+        Index("documents_user_status_created_idx", user_id, status, created_at),
+        # Finds earlier uploads of the same file (not unique: users may upload a file twice)
+        Index("documents_content_hash_idx", content_hash),
+    )
@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Text, DateTime, ForeignKey, Integer, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from pgvector.sqlalchemy import Vector
+import uuid
+from ..database import Base
+
+class DocumentChunk(Base):
+    __tablename__ = "document_chunks"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    content = Column(Text, nullable=False)
+    embedding = Column(Vector(768), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    document = relationship("Document", back_populates="chunks")
+
+    __table_args__ = (
+        # Also serves lookups and deletes by document_id
+        UniqueConstraint("document_id", "chunk_index", name="document_chunks_document_chunk_key"),
+    )
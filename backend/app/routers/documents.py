@@ -11,7 +11,7 @@ router = APIRouter(prefix="/documents", tags=["documents"])
 
 @router.put("/{document_id}", response_model=DocumentResponse)
 def update_document(document_id: UUID, document_update: DocumentUpdate, db: Session = Depends(get_db)):
-    document = db.query(Document).filter(Document.id == document_id).first()
+    document = db.get(Document, document_id)
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
 
@@ -25,7 +25,7 @@ def update_document(document_id: UUID, document_update: DocumentUpdate, db: Sess
 
 @router.delete("/{document_id}", status_code=204)
 def delete_document(document_id: UUID, db: Session = Depends(get_db)):
-    document = db.query(Document).filter(Document.id == document_id).first()
+    document = db.get(Document, document_id)
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
 
@@ -39,15 +39,16 @@ def delete_document(document_id: UUID, db: Session = Depends(get_db)):
 
 @router.get("/{document_id}/download")
 def download_document(document_id: UUID, db: Session = Depends(get_db)):
-    document = db.query(Document).filter(Document.id == document_id).first()
+    document = db.get(Document, document_id)
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    # Get file path and verify it exists
-    file_path = file_storage.get_file_path(document.file_path)
+    # Get file path and verify it exists (stat once, reused by FileResponse)
+    file_path, stat_result = file_storage.get_file_stat(document.file_path)
 
     return FileResponse(
         path=file_path,
+        stat_result=stat_result,
         filename=document.original_filename,
         media_type=document.mime_type or "application/pdf",
         headers={"Content-Disposition": f"attachment; filename={document.original_filename}"}
@@ -55,15 +56,16 @@ def download_document(document_id: UUID, db: Session = Depends(get_db)):
 
 @router.get("/{document_id}/view")
 def view_document(document_id: UUID, db: Session = Depends(get_db)):
-    document = db.query(Document).filter(Document.id == document_id).first()
+    document = db.get(Document, document_id)
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    # Get file path and verify it exists
-    file_path = file_storage.get_file_path(document.file_path)
+    # Get file path and verify it exists (stat once, reused by FileResponse)
+    file_path, stat_result = file_storage.get_file_stat(document.file_path)
 
     return FileResponse(
         path=file_path,
+        stat_result=stat_result,
         media_type=document.mime_type or "application/pdf",
         headers={"Content-Disposition": "inline"}
     )
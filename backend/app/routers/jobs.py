@@ -1,18 +1,30 @@
 from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy.orm import Session
 from sqlalchemy import text
+from pgvector.sqlalchemy import Vector
 from pydantic import BaseModel
 from typing import List, Optional
 import numpy as np
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ..config import settings
 from ..database import get_db
-from ..services.ai import get_embedding, extract_job_title
+from ..services.ai import (
+    embed_parallel, get_embeddings_batch, extract_job_title, JOB_TITLE_CONTEXT_CHARS
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/jobs", tags=["jobs"])
 
 # Thread pool for running sync JobSpy in async context
-executor = ThreadPoolExecutor(max_workers=2)
+executor = ThreadPoolExecutor(max_workers=8)
+
+# Separate pool for per-site scrapes so searches never wait on their own pool
+site_executor = ThreadPoolExecutor(max_workers=6)
+
+JOB_SITES = ["indeed", "linkedin", "glassdoor"]
 
 
 class JobMatchRequest(BaseModel):
@@ -53,11 +65,30 @@ class WeeklyDigestResponse(BaseModel):
     digests: List[UserDigest]
 
 
-def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
-    """Calculate cosine similarity between two vectors"""
-    a = np.array(vec1)
-    b = np.array(vec2)
-    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+def cosine_similarities(query: np.ndarray, vectors: List[np.ndarray]) -> np.ndarray:
+    """
+    Calculate cosine similarity between one query vector and many vectors.
+    Rows are normalized once and scored with a single matrix-vector product.
+    """
+    matrix = np.stack(vectors).astype(np.float32, copy=False)
+    q = np.asarray(query, dtype=np.float32)
+
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(q)
+    norms[norms == 0] = 1.0  # Zero vectors score 0 instead of NaN
+
+    return (matrix @ q) / norms
+
+
+def parse_embedding(value) -> np.ndarray:
+    """
+    Convert a pgvector column value to a float32 NumPy vector.
+    Accepts arrays returned by the pgvector type as well as raw '[0.1,0.2,...]' strings.
+    """
+    if isinstance(value, np.ndarray):
+        return value.astype(np.float32, copy=False)
+    if isinstance(value, str):
+        return np.fromstring(value.strip('[]'), sep=',', dtype=np.float32)
+    return np.asarray(value, dtype=np.float32)
 
 
 def search_jobs_sync(
@@ -68,24 +99,41 @@ def search_jobs_sync(
 ) -> List[dict]:
     """
     Search for jobs using JobSpy library (synchronous).
+    Each job board is scraped in its own thread and the results are merged.
     Returns list of job dictionaries.
     """
     try:
         from jobspy import scrape_jobs
         import pandas as pd
 
-        jobs_df = scrape_jobs(
-            site_name=["indeed", "linkedin", "glassdoor"],
-            search_term=search_term,
-            location=location,
-            results_wanted=results_wanted,
-            is_remote=is_remote,
-            country_indeed="USA"
-        )
+        futures = {
+            site_executor.submit(
+                scrape_jobs,
+                site_name=[site],
+                search_term=search_term,
+                location=location,
+                results_wanted=results_wanted,
+                is_remote=is_remote,
+                country_indeed="USA"
+            ): site
+            for site in JOB_SITES
+        }
 
-        if jobs_df is None or jobs_df.empty:
+        frames = []
+        for future in as_completed(futures):
+            try:
+                site_df = future.result()
+            except Exception as e:
+                logger.warning("JobSpy search on %s failed: %s", futures[future], e)
+                continue
+            if site_df is not None and not site_df.empty:
+                frames.append(site_df)
+
+        if not frames:
             return []
 
+        jobs_df = pd.concat(frames, ignore_index=True)
+
         # Convert DataFrame to list of dicts
         jobs = []
         for idx, row in jobs_df.iterrows():
@@ -103,7 +151,7 @@ def search_jobs_sync(
         return jobs
 
     except Exception as e:
-        print(f"[JobSpy] Error searching jobs: {e}")
+        logger.warning("JobSpy search failed: %s", e)
         return []
 
 
@@ -125,24 +173,54 @@ async def search_jobs_async(
     )
 
 
+async def embed_job_texts(texts: List[str]) -> List[Optional[np.ndarray]]:
+    """
+    Embed job texts with a single batched API call. Repeated texts (reposts,
+    postings the weekly digest sees for many users) are served from the
+    embedding cache in get_embeddings_batch.
+    Falls back to concurrent per-text calls if the batch request fails;
+    texts that still fail to embed get None.
+    """
+    try:
+        return list(await get_embeddings_batch(texts))
+    except Exception as e:
+        logger.warning("Batch embedding failed, falling back to per-job requests: %s", e)
+        return await embed_parallel(texts)
+
+
 async def process_jobs_with_embeddings(
     jobs: List[dict],
-    resume_embedding: List[float]
+    resume_embedding: np.ndarray,
+    limit: Optional[int] = None
 ) -> List[JobMatch]:
-    """Generate embeddings for jobs and calculate similarity scores"""
+    """
+    Generate embeddings for jobs and calculate similarity scores.
+    Returns matches ranked by similarity (highest first), at most `limit` of them.
+    """
     matches = []
 
-    for job in jobs:
-        try:
-            # Create combined text for embedding
-            job_text = f"{job['title']} at {job['company']}. {job['description']}"
+    # Create combined text for embedding
+    texts = [f"{job['title']} at {job['company']}. {job['description']}" for job in jobs]
+
+    # Get all job embeddings from cloud API in one batch
+    embeddings = await embed_job_texts(texts)
+
+    embedded = [(job, emb) for job, emb in zip(jobs, embeddings) if emb is not None]
+    if not embedded:
+        return matches
 
-            # Get embedding from cloud API
-            job_embedding = await get_embedding(job_text)
+    # Calculate all similarities at once
+    similarities = cosine_similarities(resume_embedding, [emb for _, emb in embedded])
 
-            # Calculate similarity
-            similarity = cosine_similarity(resume_embedding, job_embedding)
+    # Rank in NumPy and only build JobMatch objects for the jobs returned
+    ranking = np.argsort(-similarities, kind="stable")
+    if limit is not None:
+        ranking = ranking[:limit]
 
+    for index in ranking.tolist():
+        job = embedded[index][0]
+        similarity = float(similarities[index])
+        try:
             matches.append(JobMatch(
                 id=job["id"],
                 title=job["title"],
@@ -156,11 +234,9 @@ async def process_jobs_with_embeddings(
             ))
 
         except Exception as e:
-            print(f"[Jobs] Failed to process job {job.get('id')}: {e}")
+            logger.warning("Failed to process job %s: %s", job.get("id"), e)
             continue
 
-    # Sort by similarity score (highest first)
-    matches.sort(key=lambda x: x.similarity_score, reverse=True)
     return matches
 
 
@@ -172,19 +248,19 @@ async def match_jobs(request: JobMatchRequest, db: Session = Depends(get_db)):
     1. Fetches the document's content and embedding from the database
     2. Extracts job keywords from CV using LLM (Groq)
     3. Searches for jobs via JobSpy library
-    4. Generates embeddings for each job (Hugging Face)
+    4. Generates embeddings for all jobs in one batch (Cohere)
     5. Ranks jobs by cosine similarity to resume
     """
 
-    # Get document with embedding
+    # Get document with embedding (only the part of the content the LLM sees)
     result = db.execute(
         text("""
-            SELECT id, content, embedding
+            SELECT id, substr(content, 1, :content_chars) AS content, embedding
             FROM documents
             WHERE id = :document_id
             AND embedding IS NOT NULL
-        """),
-        {"document_id": request.document_id}
+        """).columns(embedding=Vector(768)),
+        {"document_id": request.document_id, "content_chars": JOB_TITLE_CONTEXT_CHARS}
     ).fetchone()
 
     if not result:
@@ -194,12 +270,10 @@ async def match_jobs(request: JobMatchRequest, db: Session = Depends(get_db)):
         )
 
     # Parse the embedding from pgvector format
-    resume_embedding = result.embedding
-    if isinstance(resume_embedding, str):
-        resume_embedding = [float(x) for x in resume_embedding.strip('[]').split(',')]
+    resume_embedding = parse_embedding(result.embedding)
 
     # Extract job keywords from CV content using cloud LLM
-    search_term = await extract_job_title(result.content or "")
+    search_term = await extract_job_title(result.content or "", resume_embedding)
 
     # Search for jobs using JobSpy
     jobs = await search_jobs_async(
@@ -240,67 +314,73 @@ async def get_weekly_digest(
     Returns top job matches for each user's most recent document.
     """
 
-    # Get all users with documents that have embeddings
+    # Get each user's most recent document that has an embedding.
+    # The ordering matches documents_embedding_notnull_idx (user_id, created_at DESC).
     users_with_docs = db.execute(
         text("""
-            SELECT DISTINCT ON (u.id)
-                u.id as user_id,
+            SELECT DISTINCT ON (d.user_id)
+                d.user_id,
                 u.email,
                 d.id as document_id,
                 d.original_filename,
-                d.content,
+                substr(d.content, 1, :content_chars) AS content,
                 d.embedding
-            FROM users u
-            JOIN documents d ON d.user_id = u.id
+            FROM documents d
+            JOIN users u ON u.id = d.user_id
             WHERE d.embedding IS NOT NULL
-            ORDER BY u.id, d.created_at DESC
-        """)
+            ORDER BY d.user_id, d.created_at DESC
+        """).columns(embedding=Vector(768)),
+        {"content_chars": JOB_TITLE_CONTEXT_CHARS}
     ).fetchall()
 
     if not users_with_docs:
         return WeeklyDigestResponse(total_users=0, digests=[])
 
-    digests = []
+    # Bound concurrent users so Groq/Cohere rate limits are respected
+    semaphore = asyncio.Semaphore(settings.digest_concurrency)
 
-    for row in users_with_docs:
-        try:
-            # Parse embedding
-            resume_embedding = row.embedding
-            if isinstance(resume_embedding, str):
-                resume_embedding = [float(x) for x in resume_embedding.strip('[]').split(',')]
+    async def process_user(row) -> Optional[UserDigest]:
+        async with semaphore:
+            try:
+                # Parse embedding
+                resume_embedding = parse_embedding(row.embedding)
 
-            # Extract job keywords from CV
-            search_term = await extract_job_title(row.content or "")
+                # Extract job keywords from CV
+                search_term = await extract_job_title(row.content or "", resume_embedding)
 
-            # Search for jobs
-            jobs = await search_jobs_async(
-                search_term=search_term,
-                location=location,
-                results_wanted=15,
-                is_remote=is_remote
-            )
+                # Search for jobs
+                jobs = await search_jobs_async(
+                    search_term=search_term,
+                    location=location,
+                    results_wanted=15,
+                    is_remote=is_remote
+                )
 
-            if not jobs:
-                continue
+                if not jobs:
+                    return None
+
+                # Process jobs with embeddings, keeping only the best matches
+                top_matches = await process_jobs_with_embeddings(jobs, resume_embedding, limit=top_n)
+
+                logger.info("Weekly digest for %s: %d matches for %r", row.email, len(top_matches), search_term)
 
-            # Process jobs with embeddings
-            matches = await process_jobs_with_embeddings(jobs, resume_embedding)
-            top_matches = matches[:top_n]
+                if not top_matches:
+                    return None
 
-            if top_matches:
-                digests.append(UserDigest(
+                return UserDigest(
                     user_id=str(row.user_id),
                     email=row.email,
                     document_name=row.original_filename,
                     search_term=search_term,
                     top_matches=top_matches
-                ))
+                )
 
-            print(f"[WeeklyDigest] Processed user {row.email}: {len(top_matches)} matches for '{search_term}'")
+            except Exception as e:
+                logger.warning("Weekly digest failed for %s: %s", row.email, e)
+                return None
 
-        except Exception as e:
-            print(f"[WeeklyDigest] Error processing user {row.email}: {e}")
-            continue
+    results = await asyncio.gather(*(process_user(row) for row in users_with_docs))
+    digests = [digest for digest in results if digest is not None]
 
     return WeeklyDigestResponse(
         total_users=len(digests),
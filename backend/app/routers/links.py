@@ -9,7 +9,7 @@ router = APIRouter(prefix="/links", tags=["links"])
 
 @router.put("/{link_id}", response_model=LinkResponse)
 def update_link(link_id: UUID, link_update: LinkUpdate, db: Session = Depends(get_db)):
-    link = db.query(Link).filter(Link.id == link_id).first()
+    link = db.get(Link, link_id)
     if not link:
         raise HTTPException(status_code=404, detail="Link not found")
 
@@ -23,7 +23,7 @@ def update_link(link_id: UUID, link_update: LinkUpdate, db: Session = Depends(ge
 
 @router.delete("/{link_id}", status_code=204)
 def delete_link(link_id: UUID, db: Session = Depends(get_db)):
-    link = db.query(Link).filter(Link.id == link_id).first()
+    link = db.get(Link, link_id)
     if not link:
         raise HTTPException(status_code=404, detail="Link not found")
 
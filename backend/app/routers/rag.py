@@ -1,16 +1,41 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
-from typing import List, Optional
-import cohere
+from typing import List, NamedTuple, Optional
+from cachetools import LRUCache
+import asyncio
+import logging
+import numpy as np
+import orjson
 
-from ..database import get_db
-from ..services.ai import COHERE_API_KEY, GROQ_API_KEY, GROQ_URL
-import httpx
+from ..database import get_async_db
+from ..services.ai import (
+    COHERE_API_KEY, GROQ_API_KEY, LLM_CONTEXT_TOKENS, CircuitOpenError,
+    embed_query, groq_chat_completion, count_tokens, truncate_to_tokens
+)
+from ..config import settings
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/rag", tags=["rag"])
 
+# Chunks fetched per requested document before keeping the best chunk of each
+CHUNK_CANDIDATES_PER_DOCUMENT = 4
+
+# Characters of each retrieved document's text used as context
+DOCUMENT_CONTEXT_CHARS = 1500
+
+# Maximum tokens in a generated answer
+RAG_ANSWER_MAX_TOKENS = 1000
+
+# Headroom for the prompt template and tokenizer differences (cl100k_base vs Llama 3)
+PROMPT_SAFETY_TOKENS = 256
+
+# Embeddings of recent (normalized) queries, so repeated questions skip the embedding call
+_query_embedding_cache: LRUCache = LRUCache(maxsize=1024)
+_query_cache_stats = {"hits": 0, "misses": 0}
+
 class RAGQueryRequest(BaseModel):
     user_id: str
     query: str
@@ -21,14 +46,177 @@ class DocumentSource(BaseModel):
     filename: str
     similarity: str
 
+class RetrievedDocument(NamedTuple):
+    original_filename: str
+    content: str
+    similarity_score: float
+
 class RAGQueryResponse(BaseModel):
     answer: str
     query: str
     sources: List[DocumentSource]
     tokens_used: int
 
+async def _embed_query(query: str) -> np.ndarray:
+    """
+    Embed a (normalized) search query, memoized so repeated questions skip the
+    embedding API call. Cached vectors are read-only so callers can't alter them.
+    """
+    cached = _query_embedding_cache.get(query)
+    if cached is not None:
+        _query_cache_stats["hits"] += 1
+        return cached
+
+    _query_cache_stats["misses"] += 1
+    embedding = await embed_query(query)
+    embedding.flags.writeable = False
+    _query_embedding_cache[query] = embedding
+    return embedding
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a query so trivially different spellings share a cache entry"""
+    return query.strip().lower()
+
+
+@router.get("/cache/stats")
+def get_cache_stats():
+    """Hit/miss statistics for the query embedding cache"""
+    return {
+        **_query_cache_stats,
+        "maxsize": _query_embedding_cache.maxsize,
+        "currsize": _query_embedding_cache.currsize
+    }
+
+
+def _chunk_search_sql(scope_filter: str):
+    # Nearest chunks first; fetch extra candidates so that after keeping the
+    # best chunk per document there are still up to top_k documents left
+    return text(f"""
+        SELECT
+            c.id,
+            c.document_id,
+            d.original_filename,
+            1 - (c.embedding <=> CAST(:embedding AS vector)) as similarity_score
+        FROM document_chunks c
+        JOIN documents d ON d.id = c.document_id
+        WHERE {scope_filter}
+            AND c.embedding IS NOT NULL
+        ORDER BY c.embedding <=> CAST(:embedding AS vector)
+        LIMIT :candidates
+    """)
+
+
+def _document_search_sql(scope_filter: str):
+    # Only documents without chunks (embedded before chunking was introduced) are
+    # searched on their document-level embedding
+    return text(f"""
+        SELECT
+            d.id,
+            d.original_filename,
+            1 - (d.embedding <=> CAST(:embedding AS vector)) as similarity_score
+        FROM documents d
+        WHERE {scope_filter}
+            AND d.content IS NOT NULL
+            AND d.embedding IS NOT NULL
+            AND NOT EXISTS (SELECT 1 FROM document_chunks c WHERE c.document_id = d.id)
+        ORDER BY d.embedding <=> CAST(:embedding AS vector)
+        LIMIT :top_k
+    """)
+
+
+# Statements are built once at import instead of on every request
+DOCUMENT_SCOPE = "d.id = CAST(:document_id AS uuid)"
+USER_SCOPE = "d.user_id = CAST(:user_id AS uuid)"
+
+CHUNK_SEARCH_BY_DOCUMENT_SQL = _chunk_search_sql(DOCUMENT_SCOPE)
+CHUNK_SEARCH_BY_USER_SQL = _chunk_search_sql(USER_SCOPE)
+DOCUMENT_SEARCH_BY_DOCUMENT_SQL = _document_search_sql(DOCUMENT_SCOPE)
+DOCUMENT_SEARCH_BY_USER_SQL = _document_search_sql(USER_SCOPE)
+
+CHUNK_CONTENT_SQL = text("""
+    SELECT id, content
+    FROM document_chunks
+    WHERE id = ANY(:ids)
+""")
+
+DOCUMENT_CONTENT_SQL = text("""
+    SELECT id, substr(content, 1, :content_chars) AS content
+    FROM documents
+    WHERE id = ANY(:ids)
+""")
+
+
+async def search_documents(
+    db: AsyncSession,
+    embedding: np.ndarray,
+    user_id: str,
+    document_id: Optional[str],
+    top_k: int
+) -> List[RetrievedDocument]:
+    """
+    Find the top_k documents most similar to the query embedding, each represented
+    by its best-matching chunk. Documents that have no chunks are ranked together
+    with them on their document-level embedding.
+
+    Ranking only reads ids, filenames and vectors; text is fetched afterwards for
+    the winners alone.
+    """
+    # Filter on a single document or on all of the user's documents
+    if document_id:
+        chunk_search_sql, document_search_sql = CHUNK_SEARCH_BY_DOCUMENT_SQL, DOCUMENT_SEARCH_BY_DOCUMENT_SQL
+        params = {"embedding": embedding, "document_id": document_id}
+    else:
+        chunk_search_sql, document_search_sql = CHUNK_SEARCH_BY_USER_SQL, DOCUMENT_SEARCH_BY_USER_SQL
+        params = {"embedding": embedding, "user_id": user_id}
+
+    chunk_rows = (await db.execute(
+        chunk_search_sql,
+        {**params, "candidates": top_k * CHUNK_CANDIDATES_PER_DOCUMENT}
+    )).all()
+
+    best_chunks = {}
+    for row in chunk_rows:
+        if row.document_id not in best_chunks:
+            best_chunks[row.document_id] = row
+            if len(best_chunks) == top_k:
+                break
+
+    unchunked_rows = (await db.execute(document_search_sql, {**params, "top_k": top_k})).all()
+
+    # Each hit remembers which table its text comes from
+    ranked = sorted(
+        [(row, CHUNK_CONTENT_SQL) for row in best_chunks.values()]
+        + [(row, DOCUMENT_CONTENT_SQL) for row in unchunked_rows],
+        key=lambda hit: hit[0].similarity_score,
+        reverse=True
+    )[:top_k]
+
+    if not ranked:
+        return []
+
+    # Fetch the text of the winners (one query per table) and merge in ranking order
+    contents = {}
+    for content_sql in (CHUNK_CONTENT_SQL, DOCUMENT_CONTENT_SQL):
+        ids = [row.id for row, row_sql in ranked if row_sql is content_sql]
+        if ids:
+            contents.update((await db.execute(
+                content_sql,
+                {"ids": ids, "content_chars": DOCUMENT_CONTEXT_CHARS}
+            )).all())
+
+    return [
+        RetrievedDocument(
+            original_filename=row.original_filename,
+            content=contents.get(row.id, ""),
+            similarity_score=row.similarity_score
+        )
+        for row, _ in ranked
+    ]
+
+
 @router.post("/query", response_model=RAGQueryResponse)
-async def query_rag(request: RAGQueryRequest, db: Session = Depends(get_db)):
+async def query_rag(request: RAGQueryRequest, db: AsyncSession = Depends(get_async_db)):
     """
     Query RAG system using semantic search + LLM generation.
 
@@ -39,78 +227,28 @@ async def query_rag(request: RAGQueryRequest, db: Session = Depends(get_db)):
     4. Generate answer using LLM (Groq)
     """
     try:
-        print(f"[RAG] Processing query: '{request.query}' for user: {request.user_id}")
+        logger.debug("Processing query %r for user %s", request.query, request.user_id)
 
         # Step 1: Generate query embedding
-        if not COHERE_API_KEY:
+        if not COHERE_API_KEY and settings.embedding_backend == "cohere":
             raise HTTPException(status_code=500, detail="COHERE_API_KEY not configured")
 
-        print(f"[RAG] Generating query embedding...")
-        co = cohere.Client(api_key=COHERE_API_KEY)
-        embed_response = co.embed(
-            texts=[request.query],
-            model="embed-english-v3.0",
-            input_type="search_query",  # Important: use search_query for queries
-            embedding_types=["float"]
+        # While the query is embedded, the session checks out its database
+        # connection for the search
+        query_embedding, _ = await asyncio.gather(
+            _embed_query(normalize_query(request.query)),
+            db.connection()
         )
-        query_embedding = embed_response.embeddings.float[0][:768]  # Truncate to 768
-        print(f"[RAG] Query embedding generated: {len(query_embedding)} dimensions")
-
-        # Format embedding as PostgreSQL vector string
-        embedding_str = "[" + ",".join(str(x) for x in query_embedding) + "]"
-
-        # Step 2: Similarity search
-        print(f"[RAG] Searching for similar documents...")
-
-        # Build SQL query with optional document_id filter
-        if request.document_id:
-            sql_query = text("""
-                SELECT
-                    id,
-                    user_id,
-                    content,
-                    original_filename,
-                    1 - (embedding <=> CAST(:embedding AS vector)) as similarity_score
-                FROM documents
-                WHERE id = CAST(:document_id AS uuid)
-                    AND content IS NOT NULL
-                    AND embedding IS NOT NULL
-                ORDER BY embedding <=> CAST(:embedding AS vector)
-                LIMIT :top_k
-            """)
-            result = db.execute(
-                sql_query,
-                {
-                    "embedding": embedding_str,
-                    "document_id": request.document_id,
-                    "top_k": request.top_k
-                }
-            )
-        else:
-            sql_query = text("""
-                SELECT
-                    id,
-                    user_id,
-                    content,
-                    original_filename,
-                    1 - (embedding <=> CAST(:embedding AS vector)) as similarity_score
-                FROM documents
-                WHERE user_id = CAST(:user_id AS uuid)
-                    AND content IS NOT NULL
-                    AND embedding IS NOT NULL
-                ORDER BY embedding <=> CAST(:embedding AS vector)
-                LIMIT :top_k
-            """)
-            result = db.execute(
-                sql_query,
-                {
-                    "embedding": embedding_str,
-                    "user_id": request.user_id,
-                    "top_k": request.top_k
-                }
-            )
+        logger.debug("Query embedding generated: %d dimensions", len(query_embedding))
 
-        documents = result.fetchall()
+        # Step 2: Similarity search (the pgvector codec sends the array as binary)
+        documents = await search_documents(
+            db,
+            query_embedding,
+            request.user_id,
+            request.document_id,
+            request.top_k
+        )
 
         if not documents:
             raise HTTPException(
@@ -118,7 +256,7 @@ async def query_rag(request: RAGQueryRequest, db: Session = Depends(get_db)):
                 detail="No documents found. Please upload a document first."
             )
 
-        print(f"[RAG] Found {len(documents)} relevant documents")
+        logger.debug("Found %d relevant documents", len(documents))
 
         # Step 3: Build context from retrieved documents
         context_parts = []
@@ -128,7 +266,7 @@ async def query_rag(request: RAGQueryRequest, db: Session = Depends(get_db)):
             similarity_pct = f"{doc.similarity_score * 100:.1f}%"
             context_parts.append(
                 f"[{similarity_pct} relevant] Document: {doc.original_filename}\n"
-                f"Content: {doc.content[:1500]}"  # Limit content per doc
+                f"Content: {doc.content[:DOCUMENT_CONTEXT_CHARS]}"  # Limit content per doc
             )
             sources.append(DocumentSource(
                 filename=doc.original_filename,
@@ -136,54 +274,60 @@ async def query_rag(request: RAGQueryRequest, db: Session = Depends(get_db)):
             ))
 
         context = "\n\n---\n\n".join(context_parts)
-        print(f"[RAG] Built context from {len(documents)} documents, total length: {len(context)} chars")
+        logger.debug("Built context from %d documents, total length: %d chars", len(documents), len(context))
 
         # Step 4: Generate answer using Groq
         if not GROQ_API_KEY:
             raise HTTPException(status_code=500, detail="GROQ_API_KEY not configured")
 
-        print(f"[RAG] Generating answer with Groq...")
+        system_prompt = (
+            "You are a helpful assistant that answers questions based on provided documents. "
+            "Only use information from the documents provided. "
+            "If the answer is not in the documents, say so clearly. "
+            "Be concise but thorough."
+        )
+
+        # Budget the context in tokens: whatever the model window leaves after the
+        # system prompt, question and answer, capped by the configured limit
+        context_budget = min(
+            settings.rag_context_tokens,
+            LLM_CONTEXT_TOKENS
+            - count_tokens(system_prompt)
+            - count_tokens(request.query)
+            - RAG_ANSWER_MAX_TOKENS
+            - PROMPT_SAFETY_TOKENS
+        )
+        context = truncate_to_tokens(context, context_budget)
 
         messages = [
             {
                 "role": "system",
-                "content": "You are a helpful assistant that answers questions based on provided documents. "
-                          "Only use information from the documents provided. "
-                          "If the answer is not in the documents, say so clearly. "
-                          "Be concise but thorough."
+                "content": system_prompt
             },
             {
                 "role": "user",
-                "content": f"Documents:\n{context[:6000]}\n\nQuestion: {request.query}\n\nAnswer:"
+                "content": f"Documents:\n{context}\n\nQuestion: {request.query}\n\nAnswer:"
             }
         ]
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                GROQ_URL,
-                headers={
-                    "Authorization": f"Bearer {GROQ_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "llama-3.1-8b-instant",
-                    "messages": messages,
-                    "temperature": 0.3,
-                    "max_tokens": 1000
-                }
-            )
+        response = await groq_chat_completion({
+            "model": "llama-3.1-8b-instant",
+            "messages": messages,
+            "temperature": 0.3,
+            "max_tokens": RAG_ANSWER_MAX_TOKENS
+        })
 
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Groq API error: {response.status_code} - {response.text}"
-                )
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Groq API error: {response.status_code} - {response.text}"
+            )
 
-            result = response.json()
-            answer = result["choices"][0]["message"]["content"].strip()
-            tokens_used = result["usage"]["total_tokens"]
+        result = orjson.loads(response.content)
+        answer = result["choices"][0]["message"]["content"].strip()
+        tokens_used = result["usage"]["total_tokens"]
 
-        print(f"[RAG] Answer generated successfully, tokens used: {tokens_used}")
+        logger.info("Answer generated for user %s, tokens used: %d", request.user_id, tokens_used)
 
         return RAGQueryResponse(
             answer=answer,
@@ -194,6 +338,8 @@ async def query_rag(request: RAGQueryRequest, db: Session = Depends(get_db)):
 
     except HTTPException:
         raise
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
-        print(f"[RAG] Error: {type(e).__name__}: {e}")
+        logger.exception("RAG query failed")
         raise HTTPException(status_code=500, detail=f"RAG query failed: {str(e)}")
@@ -1,136 +1,318 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks, Query, Response
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, text
-from typing import List, Optional
-from uuid import UUID
-from datetime import datetime, timedelta
-from ..database import get_db, SessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text, select
+from sqlalchemy.exc import IntegrityError
+from typing import List, NamedTuple, Optional, Tuple
+from uuid import UUID, uuid4
+import asyncio
+import logging
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from ..database import get_db, get_async_db, async_engine
 from ..models import User, Document
 from ..schemas import (
-    DocumentCreate, DocumentResponse, StatsResponse,
+    DocumentCreate, DocumentResponse, DocumentListItem, StatsResponse,
     DocumentUploadResult, BatchUploadResponse
 )
 from ..services import file_storage, pdf_extractor
-from ..services.ai import get_embedding
+from ..services.ai import get_embeddings_batch
+from ..services.chunking import chunk_text, near_duplicate_indices
 from ..config import settings
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/users", tags=["users"])
 
+# Bounds concurrent background embedding requests (each covers one upload request)
+embedding_semaphore = asyncio.Semaphore(4)
 
-async def generate_document_embedding(document_id: str, content: str):
-    """Background task to generate and store document embedding"""
-    try:
-        print(f"[Embedding] Starting embedding generation for document {document_id}")
-        print(f"[Embedding] Content length: {len(content)} chars")
 
-        # Generate embedding using Cohere API
-        embedding = await get_embedding(content[:8000])
-        print(f"[Embedding] Generated embedding with {len(embedding)} dimensions")
+class EmbeddedDocument(NamedTuple):
+    document_id: UUID
+    embedding: np.ndarray
+    chunks: List[str]
+    chunk_embeddings: np.ndarray
 
-        # Convert embedding list to PostgreSQL vector format: [0.1,0.2,0.3]
-        # pgvector expects a string like "[0.1,0.2,0.3]" without spaces
-        embedding_str = "[" + ",".join(str(x) for x in embedding) + "]"
-        print(f"[Embedding] Formatted embedding string (first 100 chars): {embedding_str[:100]}...")
 
-        # Store embedding in database
-        db = SessionLocal()
-        try:
-            print(f"[Embedding] Updating database for document {document_id}")
-            result = db.execute(
-                text("""
-                    UPDATE documents
-                    SET embedding = CAST(:embedding AS vector)
-                    WHERE id = CAST(:document_id AS uuid)
-                """),
-                {
-                    "embedding": embedding_str,
-                    "document_id": document_id
-                }
+async def flush_document_embeddings(documents: List[EmbeddedDocument]) -> int:
+    """
+    Store the embeddings of several documents in one transaction using binary COPY
+    (the pgvector codec sends vectors as float32 arrays, not text literals).
+
+    Chunks are replaced so re-embedding is idempotent; document vectors are copied
+    into a temp table and applied with a single UPDATE ... FROM, since COPY can't
+    update existing rows. Returns the number of documents updated.
+    """
+    async with async_engine.connect() as conn:
+        raw = (await conn.get_raw_connection()).driver_connection
+        async with raw.transaction():
+            # Lock the documents against deletion; ones deleted in the meantime are skipped
+            existing = {
+                row["id"] for row in await raw.fetch(
+                    "SELECT id FROM documents WHERE id = ANY($1::uuid[]) FOR KEY SHARE",
+                    [document.document_id for document in documents]
+                )
+            }
+            documents = [document for document in documents if document.document_id in existing]
+            if not documents:
+                return 0
+
+            await raw.execute(
+                "DELETE FROM document_chunks WHERE document_id = ANY($1::uuid[])",
+                [document.document_id for document in documents]
+            )
+            await raw.copy_records_to_table(
+                "document_chunks",
+                columns=["id", "document_id", "chunk_index", "content", "embedding"],
+                records=[
+                    (uuid4(), document.document_id, index, chunk, embedding)
+                    for document in documents
+                    for index, (chunk, embedding) in enumerate(zip(document.chunks, document.chunk_embeddings))
+                ]
             )
-            db.commit()
-            print(f"[Embedding] Database update affected {result.rowcount} rows")
 
-            # Verify the update
-            verify_result = db.execute(
-                text("SELECT embedding IS NOT NULL as has_embedding FROM documents WHERE id = CAST(:document_id AS uuid)"),
-                {"document_id": document_id}
-            ).first()
+            await raw.execute("""
+                CREATE TEMP TABLE document_embeddings_staging (
+                    id uuid PRIMARY KEY,
+                    embedding vector(768)
+                ) ON COMMIT DROP
+            """)
+            await raw.copy_records_to_table(
+                "document_embeddings_staging",
+                records=[(document.document_id, document.embedding) for document in documents]
+            )
+            status = await raw.execute("""
+                UPDATE documents d
+                SET embedding = s.embedding
+                FROM document_embeddings_staging s
+                WHERE d.id = s.id
+            """)
 
-            if verify_result and verify_result[0]:
-                print(f"[Embedding] ✓ Successfully stored embedding for document {document_id}")
-            else:
-                print(f"[Embedding] ✗ Warning: Embedding is still NULL after update for document {document_id}")
+    return int(status.split()[-1])
 
-        except Exception as db_error:
-            print(f"[Embedding] Database error: {type(db_error).__name__}: {db_error}")
-            raise
-        finally:
-            db.close()
 
-    except Exception as e:
-        print(f"[Embedding] Failed to generate embedding for document {document_id}: {type(e).__name__}: {e}")
-        import traceback
-        print(f"[Embedding] Traceback: {traceback.format_exc()}")
+async def generate_documents_embeddings(documents: List[Tuple[str, str]]):
+    """
+    Background task to chunk documents, embed them and store the embeddings.
+
+    Takes (document_id, content) pairs. The document-level embeddings (used for job
+    matching) and one embedding per chunk (used for RAG) of all documents are
+    requested in a single batch call and written in one transaction.
+    """
+    try:
+        texts: List[str] = []
+        plans = []
 
+        for document_id, content in documents:
+            logger.debug("Starting embedding generation for document %s (%d chars)", document_id, len(content))
 
-@router.get("/{user_id}/documents", response_model=List[DocumentResponse])
-def get_user_documents(user_id: UUID, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+            chunks = chunk_text(content)
+            if not chunks:
+                logger.info("No text to embed for document %s", document_id)
+                continue
+
+            # Repeated boilerplate (headers, footers) is embedded once and its vector reused
+            sources = near_duplicate_indices(chunks)
+            unique = sorted(set(sources))
+
+            # A single-chunk document doubles as its own document-level text
+            document_row = len(texts)
+            if len(chunks) > 1:
+                texts.append(content)
+            chunk_row = len(texts)
+            texts.extend(chunks[index] for index in unique)
+
+            position = {index: chunk_row + row for row, index in enumerate(unique)}
+            plans.append((UUID(str(document_id)), chunks, document_row, [position[index] for index in sources]))
+
+        if not plans:
+            return
+
+        # Generate embeddings using Cohere API (up to 96 texts per request)
+        async with embedding_semaphore:
+            embeddings = await get_embeddings_batch(texts)
+        logger.debug(
+            "Generated %d embeddings for %d documents with %d dimensions",
+            len(embeddings), len(plans), embeddings.shape[1]
+        )
+
+        updated = await flush_document_embeddings([
+            EmbeddedDocument(document_id, embeddings[document_row], chunks, embeddings[chunk_rows])
+            for document_id, chunks, document_row, chunk_rows in plans
+        ])
+        logger.info("Stored embeddings for %d of %d documents", updated, len(plans))
+
+    except Exception:
+        logger.exception("Failed to generate embeddings for documents %s", [document_id for document_id, _ in documents])
+
+
+async def generate_document_embedding(document_id: str, content: str):
+    """
+    Background task to chunk a single document, embed it and store the embeddings.
+    """
+    await generate_documents_embeddings([(document_id, content)])
+
+
+def find_duplicate_document(db: Session, content_hash: bytes, user_id: UUID):
+    """
+    Find an earlier upload of the same file, preferring the user's own copy and
+    then one whose embeddings are done.
+    Returns a row with id, user_id, content and embedded, or None.
+    """
+    return db.execute(
+        text("""
+            SELECT
+                d.id,
+                d.user_id,
+                d.content,
+                d.embedding IS NOT NULL
+                    AND EXISTS (SELECT 1 FROM document_chunks c WHERE c.document_id = d.id) AS embedded
+            FROM documents d
+            WHERE d.content_hash = :content_hash
+                AND d.content IS NOT NULL
+                -- Failed extractions may succeed on retry; never reuse them
+                AND d.content NOT LIKE '[PDF text extraction failed:%'
+                AND d.content NOT LIKE '[Text extraction failed:%'
+            ORDER BY d.user_id = CAST(:user_id AS uuid) DESC, embedded DESC, d.created_at DESC
+            LIMIT 1
+        """),
+        {"content_hash": content_hash, "user_id": str(user_id)}
+    ).first()
+
+
+def copy_document_embeddings(db: Session, source_id: UUID, target_id: UUID):
+    """Copy the document embedding and chunks of source_id to target_id (no Cohere calls)"""
+    params = {"source_id": str(source_id), "target_id": str(target_id)}
+    db.execute(
+        text("""
+            UPDATE documents
+            SET embedding = source.embedding
+            FROM documents source
+            WHERE documents.id = CAST(:target_id AS uuid)
+                AND source.id = CAST(:source_id AS uuid)
+        """),
+        params
+    )
+    db.execute(
+        text("""
+            INSERT INTO document_chunks (id, document_id, chunk_index, content, embedding)
+            SELECT gen_random_uuid(), CAST(:target_id AS uuid), chunk_index, content, embedding
+            FROM document_chunks
+            WHERE document_id = CAST(:source_id AS uuid)
+        """),
+        params
+    )
+
+
+def ensure_user_exists(db: Session, user_id: UUID):
+    """
+    Raise 404 if the user doesn't exist.
+    Only called when a user-scoped query comes back empty, so the common
+    path (existing user with data) doesn't pay for an extra round-trip.
+    """
+    exists = db.execute(
+        text("SELECT 1 FROM users WHERE id = CAST(:user_id AS uuid)"),
+        {"user_id": str(user_id)}
+    ).scalar()
+    if not exists:
+        raise HTTPException(status_code=404, detail="User not found")
+
+
+async def ensure_user_exists_async(db: AsyncSession, user_id: UUID):
+    """Async variant of ensure_user_exists for endpoints on the async engine"""
+    exists = (await db.execute(
+        text("SELECT 1 FROM users WHERE id = :user_id"),
+        {"user_id": user_id}
+    )).scalar()
+    if not exists:
         raise HTTPException(status_code=404, detail="User not found")
 
-    documents = db.query(Document).filter(Document.user_id == user_id).order_by(Document.created_at.desc()).all()
-    return documents
+
+@router.get("/{user_id}/documents", response_model=List[DocumentListItem])
+def get_user_documents(
+    user_id: UUID,
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db)
+):
+    # Select only the listed columns: the extracted text can be megabytes per document
+    rows = db.execute(
+        select(
+            Document.id,
+            Document.user_id,
+            Document.file_path,
+            Document.original_filename,
+            Document.file_size,
+            Document.mime_type,
+            Document.title,
+            Document.status,
+            Document.created_at,
+            Document.updated_at
+        ).where(
+            Document.user_id == user_id
+        ).order_by(
+            Document.created_at.desc()
+        ).limit(limit).offset(offset)
+    ).mappings().all()
+
+    # Empty result: distinguish "no documents" from "no such user"
+    if not rows:
+        ensure_user_exists(db, user_id)
+
+    # Plain rows go straight to orjson (UUIDs and datetimes are native to it); the
+    # response_model only documents the shape and is not re-validated
+    return ORJSONResponse([dict(row) for row in rows])
 
 @router.post("/{user_id}/documents", response_model=DocumentResponse, status_code=201)
 async def upload_document(
     user_id: UUID,
     background_tasks: BackgroundTasks,
+    response: Response,
     file: UploadFile = File(...),
     title: Optional[str] = Form(None),
     db: Session = Depends(get_db)
 ):
-    # Verify user exists
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
     # Validate file type
     if file.content_type != "application/pdf":
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
 
-    # Validate file size (check against configured max)
-    file_size = 0
-    temp_content = await file.read()
-    file_size = len(temp_content)
-
-    if file_size > settings.max_file_size:
-        raise HTTPException(
-            status_code=400,
-            detail=f"File size exceeds maximum allowed size of {settings.max_file_size / (1024 * 1024)}MB"
-        )
-
-    # Reset file pointer for saving
-    await file.seek(0)
-
-    # Save file to storage
+    # Stream file to storage (enforces the configured max size while writing)
     try:
         file_metadata = await file_storage.save_uploaded_file(
             user_id=user_id,
             file=file,
-            upload_dir=settings.upload_dir
+            upload_dir=settings.upload_dir,
+            max_size=settings.max_file_size
         )
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
 
-    # Extract text from PDF
-    try:
-        extracted_text = pdf_extractor.extract_text_from_pdf(file_metadata["file_path"])
-    except Exception as e:
-        # If extraction fails, set a default message
-        extracted_text = f"[Text extraction failed: {str(e)}]"
+    # The same file was uploaded before: reuse its text instead of parsing the PDF again
+    # (only successful extractions are matched, so a failed one is retried here)
+    duplicate = find_duplicate_document(db, file_metadata["content_hash"], user_id)
+    if duplicate and duplicate.user_id == user_id:
+        # The user already has this file: drop the new copy and return the existing document
+        file_storage.delete_file(file_metadata["file_path"])
+        existing = db.get(Document, duplicate.id)
+        if title and title != existing.title:
+            existing.title = title
+            db.commit()
+            db.refresh(existing)
+        response.status_code = 200
+        return existing
+    if duplicate:
+        extracted_text = duplicate.content
+    else:
+        # Extract text from PDF
+        try:
+            extracted_text = await pdf_extractor.extract_text_from_pdf_async(file_metadata["file_path"])
+        except Exception as e:
+            # If extraction fails, set a default message
+            extracted_text = f"[Text extraction failed: {str(e)}]"
 
     # Create document record in database
     new_document = Document(
@@ -141,18 +323,30 @@ async def upload_document(
         mime_type=file_metadata["mime_type"],
         title=title,
         content=extracted_text,
+        # Failed extractions aren't offered for reuse by later uploads of the same file
+        content_hash=None if pdf_extractor.extraction_failed(extracted_text) else file_metadata["content_hash"],
         status="processed"  # Set to processed after successful extraction
     )
     db.add(new_document)
-    db.commit()
+    try:
+        db.flush()
+        if duplicate and duplicate.embedded:
+            copy_document_embeddings(db, duplicate.id, new_document.id)
+        db.commit()
+    except IntegrityError:
+        # The user_id foreign key failed: the user doesn't exist
+        db.rollback()
+        file_storage.delete_file(file_metadata["file_path"])
+        raise HTTPException(status_code=404, detail="User not found")
     db.refresh(new_document)
 
-    # Generate embedding in background (non-blocking)
-    background_tasks.add_task(
-        generate_document_embedding,
-        document_id=str(new_document.id),
-        content=extracted_text
-    )
+    # Generate embedding in background (non-blocking) unless it was copied
+    if not (duplicate and duplicate.embedded):
+        background_tasks.add_task(
+            generate_document_embedding,
+            document_id=str(new_document.id),
+            content=extracted_text
+        )
 
     return new_document
 
@@ -182,11 +376,14 @@ async def upload_documents_batch(
     results = []
     successful_count = 0
     failed_count = 0
+    # (document_id, content) of new documents, embedded together after the loop
+    pending_embeddings = []
 
     # Process each file independently
     for file in files:
         filename = file.filename
-        result = DocumentUploadResult(
+        # Built from trusted values only, so skip validation
+        result = DocumentUploadResult.model_construct(
             success=False,
             filename=filename,
             error=None,
@@ -201,26 +398,13 @@ async def upload_documents_batch(
                 results.append(result)
                 continue
 
-            # Validate file size
-            file_content = await file.read()
-            file_size = len(file_content)
-
-            if file_size > settings.max_file_size:
-                max_size_mb = settings.max_file_size / (1024 * 1024)
-                result.error = f"File size exceeds maximum of {max_size_mb}MB"
-                failed_count += 1
-                results.append(result)
-                continue
-
-            # Reset file pointer for saving
-            await file.seek(0)
-
-            # Save file to storage
+            # Stream file to storage (enforces the configured max size while writing)
             try:
                 file_metadata = await file_storage.save_uploaded_file(
                     user_id=user_id,
                     file=file,
-                    upload_dir=settings.upload_dir
+                    upload_dir=settings.upload_dir,
+                    max_size=settings.max_file_size
                 )
             except HTTPException as http_exc:
                 result.error = http_exc.detail
@@ -233,12 +417,25 @@ async def upload_documents_batch(
                 results.append(result)
                 continue
 
-            # Extract text from PDF
-            try:
-                extracted_text = pdf_extractor.extract_text_from_pdf(file_metadata["file_path"])
-            except Exception as e:
-                # If extraction fails, set a default message but continue
-                extracted_text = f"[Text extraction failed: {str(e)}]"
+            # The same file was uploaded before: reuse its text instead of parsing the PDF again
+            duplicate = find_duplicate_document(db, file_metadata["content_hash"], user_id)
+            if duplicate and duplicate.user_id == user_id:
+                # The user already has this file: drop the new copy and report the existing document
+                file_storage.delete_file(file_metadata["file_path"])
+                result.success = True
+                result.document = DocumentResponse.model_validate(db.get(Document, duplicate.id))
+                successful_count += 1
+                results.append(result)
+                continue
+            if duplicate:
+                extracted_text = duplicate.content
+            else:
+                # Extract text from PDF
+                try:
+                    extracted_text = await pdf_extractor.extract_text_from_pdf_async(file_metadata["file_path"])
+                except Exception as e:
+                    # If extraction fails, set a default message but continue
+                    extracted_text = f"[Text extraction failed: {str(e)}]"
 
             # Create document record in database
             new_document = Document(
@@ -249,22 +446,23 @@ async def upload_documents_batch(
                 mime_type=file_metadata["mime_type"],
                 title=None,  # No per-file titles in batch mode
                 content=extracted_text,
+                content_hash=None if pdf_extractor.extraction_failed(extracted_text) else file_metadata["content_hash"],
                 status="processed"
             )
             db.add(new_document)
+            db.flush()
+            if duplicate and duplicate.embedded:
+                copy_document_embeddings(db, duplicate.id, new_document.id)
             db.commit()
             db.refresh(new_document)
 
-            # Generate embedding in background (non-blocking)
-            background_tasks.add_task(
-                generate_document_embedding,
-                document_id=str(new_document.id),
-                content=extracted_text
-            )
+            # Embed later unless the embedding was copied
+            if not (duplicate and duplicate.embedded):
+                pending_embeddings.append((str(new_document.id), extracted_text))
 
             # Success!
             result.success = True
-            result.document = new_document
+            result.document = DocumentResponse.model_validate(new_document)
             successful_count += 1
             results.append(result)
 
@@ -276,6 +474,10 @@ async def upload_documents_batch(
             # Rollback this file's transaction but continue processing
             db.rollback()
 
+    # Generate all embeddings in one background task (non-blocking), stored with one COPY
+    if pending_embeddings:
+        background_tasks.add_task(generate_documents_embeddings, pending_embeddings)
+
     # Return aggregated results
     return BatchUploadResponse(
         total_files=len(files),
@@ -285,24 +487,29 @@ async def upload_documents_batch(
     )
 
 @router.get("/{user_id}/stats", response_model=StatsResponse)
-def get_user_stats(user_id: UUID, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    total_documents = db.query(Document).filter(Document.user_id == user_id).count()
-
-    status_counts = db.query(
-        Document.status, func.count(Document.id)
-    ).filter(Document.user_id == user_id).group_by(Document.status).all()
-
-    documents_by_status = {status: count for status, count in status_counts}
-
-    seven_days_ago = datetime.utcnow() - timedelta(days=7)
-    recent_documents_count = db.query(Document).filter(
-        Document.user_id == user_id,
-        Document.created_at >= seven_days_ago
-    ).count()
+async def get_user_stats(user_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    # Totals, per-status counts and recent uploads in a single pass over the user's documents
+    seven_days_ago = datetime.now(timezone.utc) - timedelta(days=7)
+    rows = (await db.execute(
+        text("""
+            SELECT
+                status,
+                COUNT(*) AS total,
+                COUNT(*) FILTER (WHERE created_at >= :cutoff) AS recent
+            FROM documents
+            WHERE user_id = :user_id
+            GROUP BY status
+        """),
+        {"user_id": user_id, "cutoff": seven_days_ago}
+    )).all()
+
+    # Empty result: distinguish "no documents" from "no such user"
+    if not rows:
+        await ensure_user_exists_async(db, user_id)
+
+    total_documents = sum(row.total for row in rows)
+    documents_by_status = {row.status: row.total for row in rows}
+    recent_documents_count = sum(row.recent for row in rows)
 
     return StatsResponse(
         total_documents=total_documents,
@@ -1,7 +1,7 @@
 from .user import UserBase, UserCreate, UserResponse
 from .document import (
     DocumentBase, DocumentCreate, DocumentUpdate,
-    DocumentResponse, DocumentUploadResult, BatchUploadResponse
+    DocumentResponse, DocumentListItem, DocumentUploadResult, BatchUploadResponse
 )
 from .auth import LoginRequest, LoginResponse
 from .stats import StatsResponse
@@ -14,6 +14,7 @@ __all__ = [
     "DocumentCreate",
     "DocumentUpdate",
     "DocumentResponse",
+    "DocumentListItem",
     "DocumentUploadResult",
     "BatchUploadResponse",
     "LoginRequest",
@@ -28,6 +28,20 @@ class DocumentResponse(DocumentBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class DocumentListItem(DocumentBase):
+    """Document summary for list views (omits the extracted text content)"""
+    id: UUID
+    user_id: UUID
+    file_path: str
+    original_filename: str
+    file_size: Optional[int] = None
+    mime_type: Optional[str] = None
+    status: str
+    created_at: datetime
+    updated_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
 class DocumentUploadResult(BaseModel):
     """Result for a single document upload in batch operation"""
     success: bool
@@ -35,8 +49,6 @@ class DocumentUploadResult(BaseModel):
     filename: str
     error: Optional[str] = None
 
-    model_config = ConfigDict(from_attributes=True)
-
 class BatchUploadResponse(BaseModel):
     """Response for batch document upload"""
     total_files: int
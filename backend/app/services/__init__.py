@@ -1,3 +1,3 @@
-from .ai import get_embedding, generate_text, extract_job_title
+from .ai import get_embedding, get_embeddings_batch, generate_text, extract_job_title
 
-__all__ = ["get_embedding", "generate_text", "extract_job_title"]
+__all__ = ["get_embedding", "get_embeddings_batch", "generate_text", "extract_job_title"]
@@ -10,11 +10,28 @@ Environment variables required:
 - GROQ_API_KEY: Groq API key
 """
 
+import asyncio
+import hashlib
+import logging
+import threading
+import time
 import httpx
 import cohere
-from typing import List
+from cohere.core.api_error import ApiError
+import numpy as np
+import orjson
+import re
+import tiktoken
+from cachetools import LRUCache
+from tenacity import retry, retry_if_exception, retry_if_exception_type, retry_if_result, stop_after_attempt, wait_exponential_jitter
+from collections import deque
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
 from ..config import settings
 
+logger = logging.getLogger(__name__)
+
 COHERE_API_KEY = settings.cohere_api_key or ""
 GROQ_API_KEY = settings.groq_api_key or ""
 
@@ -22,115 +39,711 @@ GROQ_API_KEY = settings.groq_api_key or ""
 EMBEDDING_MODEL = "embed-english-v3.0"
 EMBEDDING_DIMENSIONS = 768
 
+# embed-english-v3.0 reads at most 512 tokens per text; the rest is cut off
+EMBEDDING_MAX_TOKENS = 512
+
+# Characters of a text considered for embedding: comfortably more than 512 tokens,
+# and cheap to hash for cache keys without running the tokenizer
+EMBEDDING_INPUT_CHARS = EMBEDDING_MAX_TOKENS * 16
+
+# Prefix BGE models expect on search queries (documents are embedded as-is)
+LOCAL_QUERY_INSTRUCTION = "Represent this sentence for searching relevant passages: "
+
+# Cohere's embed endpoint accepts at most 96 texts per request
+EMBEDDING_BATCH_SIZE = 96
+
+# Text budget per embed request, so a request of long chunks stays around 100 KB
+EMBEDDING_BATCH_MAX_CHARS = 100_000
+
+# HTTP statuses worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
 # LLM model
 LLM_MODEL = "llama-3.1-8b-instant"
 GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
 
+# Built once; the API key doesn't change while the process runs
+GROQ_HEADERS = {
+    "Authorization": f"Bearer {GROQ_API_KEY}",
+    "Content-Type": "application/json"
+}
+
+# Context window of LLM_MODEL, in tokens
+LLM_CONTEXT_TOKENS = 131072
+
+# Rough characters-per-token ratio, used only when the tokenizer can't be loaded
+CHARS_PER_TOKEN = 4
+
+# Number of CV characters sent to the LLM for job title extraction
+JOB_TITLE_CONTEXT_CHARS = 3000
+
+# CVs with less text than this can't yield a meaningful job title
+MIN_CV_CHARS = 20
+
+# Search term used when no job title can be extracted
+DEFAULT_JOB_TITLE = "general"
+
+# Static part of the job title prompt, sent as the system message so every call
+# shares the same prefix. Providers that only cache prefixes on request (e.g.
+# cache_control: {"type": "ephemeral"} on Anthropic) need this block marked.
+JOB_TITLE_INSTRUCTION = (
+    "Based on this CV/resume content, what is the most relevant job title this person should search for?\n"
+    "Return ONLY the job title (2-4 words max), nothing else. For example: \"Software Engineer\" "
+    "or \"Data Analyst\" or \"Product Manager\" or \"Marketing Specialist\"."
+)
+
+# Chatty answers like "Based on the CV, the job title is: Data Analyst" -> text after the last colon
+_JOB_TITLE_PREFIX_RE = re.compile(r"(?:based on|the |a ).*:\s*[\"']?(?P<title>[^:]*?)[\"']?$", re.IGNORECASE)
+
+# cl100k_base encoding, loaded in the background by start_tokenizer_load
+_tokenizer: Optional["tiktoken.Encoding"] = None
+_tokenizer_loading = False
+_tokenizer_next_attempt = 0.0
+_tokenizer_lock = threading.Lock()
+
+# Minimum delay before retrying a failed tokenizer load (e.g. offline at startup)
+TOKENIZER_RETRY_SECONDS = 300
+
+# Extracted job titles keyed by a hash of the CV excerpt sent to the LLM
+_job_title_cache: LRUCache = LRUCache(maxsize=1024)
+
+# Document embeddings keyed by a hash of the (truncated) input text
+_embedding_cache: LRUCache = LRUCache(maxsize=10000)
+
+# Embeddings being computed right now, keyed like _embedding_cache; concurrent
+# requests for the same text await the first request instead of calling the API again
+_embedding_inflight: Dict[str, "asyncio.Task[np.ndarray]"] = {}
+
+# Bounds concurrent embed requests, however many callers are batching at once
+_embedding_request_semaphore = asyncio.Semaphore(settings.embedding_max_inflight)
+
+# Resumes whose embeddings are at least this similar share an extracted job title
+JOB_TITLE_SIMILARITY_THRESHOLD = 0.97
+
+# Looser match accepted while the LLM is unavailable, rather than the default title
+JOB_TITLE_DEGRADED_SIMILARITY_THRESHOLD = 0.92
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider that is currently failing"""
+
+
+class CircuitBreaker:
+    """
+    Tracks the outcome of recent calls to a provider. When more than
+    failure_ratio of the last `window` calls failed, the breaker opens and
+    callers fail fast for reset_seconds instead of queueing more retries.
+    """
+
+    def __init__(self, name: str, window: int = 50, failure_ratio: float = 0.5,
+                 min_calls: int = 10, reset_seconds: float = 30.0):
+        self.name = name
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.reset_seconds = reset_seconds
+        self._results: deque = deque(maxlen=window)
+        self._opened_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        if self._opened_at is None:
+            return False
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            # Cool-down over: let calls through again with a fresh window
+            self._opened_at = None
+            self._results.clear()
+            return False
+        return True
+
+    def check(self):
+        if self.is_open:
+            raise CircuitOpenError(f"{self.name} is temporarily unavailable")
+
+    def record(self, success: bool):
+        self._results.append(success)
+        failures = self._results.count(False)
+        if len(self._results) >= self.min_calls and failures > self.failure_ratio * len(self._results):
+            if self._opened_at is None:
+                logger.warning("%s failing (%d/%d calls), circuit open", self.name, failures, len(self._results))
+            self._opened_at = time.monotonic()
+
+
+_cohere_breaker = CircuitBreaker("Cohere")
+_groq_breaker = CircuitBreaker("Groq")
+
+# Shared HTTP client so outbound API calls reuse keep-alive connections
+_http_client: Optional[httpx.AsyncClient] = None
+
+# Async Cohere client for document and query embeddings, on the shared HTTP client's pool
+_cohere_async_client: Optional[cohere.AsyncClient] = None
+
+
+def get_cohere_async_client() -> cohere.AsyncClient:
+    """
+    Get the process-wide async Cohere client, creating it on first use.
+    It sends requests through the shared HTTP client, so embedding and LLM
+    calls share one connection pool.
+    """
+    global _cohere_async_client
+    if _cohere_async_client is None:
+        _cohere_async_client = cohere.AsyncClient(api_key=COHERE_API_KEY, httpx_client=get_http_client())
+    return _cohere_async_client
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Get the process-wide HTTP client, creating it on first use.
+    HTTP/2 lets concurrent LLM calls share one multiplexed connection per host.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=60.0,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+        )
+    return _http_client
+
 
-async def get_embedding(text: str) -> List[float]:
+async def close_http_client():
+    """
+    Close the shared HTTP client (called on application shutdown).
+    """
+    global _http_client, _cohere_async_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    # The async Cohere client wraps the closed HTTP client
+    _cohere_async_client = None
+
+
+async def get_embedding(text: str) -> np.ndarray:
     """
     Get embedding vector from Cohere API.
-    Returns 768-dimensional vector (compatible with existing pgvector column).
+    Returns a read-only, unit-length float32 array of 768 dimensions
+    (compatible with existing pgvector column).
 
     Uses Cohere embed-english-v3.0 (1024 dims) and truncates to 768.
+    Results are cached by a hash of the text, so repeated texts skip the API call,
+    and concurrent calls for the same text share one request.
+    """
+    cache_key = _embedding_cache_key(text)
+    cached_embedding = _embedding_cache.get(cache_key)
+    if cached_embedding is not None:
+        logger.debug("Using cached embedding for text of length: %d chars", len(text))
+        return cached_embedding
+
+    pending = _embedding_inflight.get(cache_key)
+    if pending is None:
+        # Runs as its own task so no single caller owns (or can cancel) the shared request
+        pending = asyncio.ensure_future(_fetch_embedding(text, cache_key))
+        _embedding_inflight[cache_key] = pending
+        pending.add_done_callback(lambda task: _finish_inflight_embedding(cache_key, task))
+
+    # Shielded so a caller being cancelled doesn't cancel the request for the others
+    return await asyncio.shield(pending)
+
+
+async def _fetch_embedding(text: str, cache_key: str) -> np.ndarray:
+    # get_embeddings_batch fills the cache; the cached row is read-only and shared
+    embedding = (await get_embeddings_batch([text]))[0]
+    return _embedding_cache.get(cache_key, embedding)
+
+
+def _finish_inflight_embedding(cache_key: str, task: "asyncio.Task[np.ndarray]"):
+    if _embedding_inflight.get(cache_key) is task:
+        del _embedding_inflight[cache_key]
+    if not task.cancelled():
+        task.exception()  # Mark retrieved: every caller may have been cancelled
+
+
+async def embed_parallel(texts: List[str], max_inflight: Optional[int] = None) -> List[Optional[np.ndarray]]:
+    """
+    Embed texts one request per text, at most max_inflight (default
+    settings.embedding_max_inflight) at a time. Unlike get_embeddings_batch, a
+    failing text doesn't fail the others: texts that can't be embedded get None.
     """
+    semaphore = asyncio.Semaphore(max_inflight or settings.embedding_max_inflight)
+
+    async def embed_one(text: str) -> Optional[np.ndarray]:
+        async with semaphore:
+            try:
+                return await get_embedding(text)
+            except Exception as e:
+                logger.warning("Failed to embed text: %s", e)
+                return None
+
+    return await asyncio.gather(*(embed_one(text) for text in texts))
+
+
+def _is_retryable_cohere_error(exception: BaseException) -> bool:
+    return isinstance(exception, ApiError) and exception.status_code in RETRYABLE_STATUS_CODES
+
+
+def _is_retryable_groq_response(response: httpx.Response) -> bool:
+    return response.status_code in RETRYABLE_STATUS_CODES
+
+
+@retry(
+    retry=retry_if_exception(_is_retryable_cohere_error)
+    | retry_if_exception_type((httpx.TransportError, httpx.TimeoutException)),
+    wait=wait_exponential_jitter(initial=1, max=30),
+    stop=stop_after_attempt(5),
+    reraise=True
+)
+async def _cohere_embed_with_retry(texts: List[str], input_type: str):
+    co = get_cohere_async_client()
+    return await co.embed(
+        texts=texts,
+        model=EMBEDDING_MODEL,
+        input_type=input_type,
+        embedding_types=["float"]
+    )
+
+
+async def _cohere_embed(texts: List[str], input_type: str = "search_document"):
+    """
+    One Cohere embed call, retried with jittered exponential backoff on
+    connection errors, timeouts, rate limiting (429) and transient server errors.
+    Raises CircuitOpenError without calling Cohere while it is failing; the
+    breaker records one outcome per call, not per attempt.
+    """
+    _cohere_breaker.check()
+    try:
+        response = await _cohere_embed_with_retry(texts, input_type)
+    except Exception as e:
+        # Only outages count against Cohere, not requests it rejected as invalid
+        _cohere_breaker.record(isinstance(e, ApiError) and not _is_retryable_cohere_error(e))
+        raise
+    _cohere_breaker.record(True)
+    return response
+
+
+@retry(
+    retry=retry_if_exception_type(httpx.TransportError) | retry_if_result(_is_retryable_groq_response),
+    wait=wait_exponential_jitter(initial=1, max=30),
+    stop=stop_after_attempt(5),
+    reraise=True,
+    # Out of attempts on an error status: hand back the last response to the caller
+    retry_error_callback=lambda retry_state: retry_state.outcome.result()
+)
+async def _groq_post_with_retry(payload: dict) -> httpx.Response:
+    return await get_http_client().post(GROQ_URL, headers=GROQ_HEADERS, content=orjson.dumps(payload))
+
+
+async def groq_chat_completion(payload: dict) -> httpx.Response:
+    """
+    POST a chat completion request to Groq, retried with jittered exponential
+    backoff on connection errors, rate limiting (429) and transient server errors.
+    Raises CircuitOpenError without calling Groq while it is failing; the
+    breaker records one outcome per call, not per attempt.
+    """
+    _groq_breaker.check()
+    try:
+        response = await _groq_post_with_retry(payload)
+    except httpx.TransportError:
+        _groq_breaker.record(False)
+        raise
+    _groq_breaker.record(not _is_retryable_groq_response(response))
+    return response
+
+
+async def embed_query(query: str) -> np.ndarray:
+    """
+    Embed a search query (Cohere's "search_query" input type, or the local model's
+    query instruction). Cohere calls share the retry and circuit breaker used for
+    documents. Returns a float32 vector of 768 dimensions, not normalized.
+    """
+    if settings.embedding_backend == "onnx":
+        return (await asyncio.to_thread(local_embed, [query], True))[0]
+
     if not COHERE_API_KEY:
         raise ValueError("COHERE_API_KEY environment variable not set")
 
-    print(f"[AI Service] Requesting embedding for text of length: {len(text)} chars")
-    print(f"[AI Service] Using Cohere model: {EMBEDDING_MODEL}")
+    response = await _cohere_embed([query], input_type="search_query")
+    return np.asarray(response.embeddings.float[0][:EMBEDDING_DIMENSIONS], dtype=np.float32)
 
+
+def _plan_embedding_batches(texts: List[str]) -> List[List[int]]:
+    """
+    Group text indices into Cohere requests of at most EMBEDDING_BATCH_SIZE texts
+    and EMBEDDING_BATCH_MAX_CHARS characters. Longest texts are grouped together
+    so each request holds texts of similar length.
+    """
+    batches = []
+    current: List[int] = []
+    current_chars = 0
+
+    for index in sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True):
+        size = len(texts[index])
+        if current and (len(current) == EMBEDDING_BATCH_SIZE or current_chars + size > EMBEDDING_BATCH_MAX_CHARS):
+            batches.append(current)
+            current, current_chars = [], 0
+        current.append(index)
+        current_chars += size
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+@lru_cache(maxsize=1)
+def _get_local_embedder():
+    """
+    Load the ONNX embedding model and its tokenizer on first use.
+    onnxruntime and tokenizers are only needed with EMBEDDING_BACKEND=onnx.
+    """
     try:
-        # Initialize Cohere client
-        co = cohere.Client(api_key=COHERE_API_KEY)
-
-        # Get embedding
-        # Cohere's embed method returns embeddings for a list of texts
-        response = co.embed(
-            texts=[text[:8000]],  # Truncate to 8000 chars
-            model=EMBEDDING_MODEL,
-            input_type="search_document",  # For document embeddings (vs "search_query")
-            embedding_types=["float"]
-        )
+        import onnxruntime
+        from tokenizers import Tokenizer
+    except ImportError as e:
+        raise ValueError("EMBEDDING_BACKEND=onnx requires the onnxruntime and tokenizers packages") from e
 
-        # Extract the embedding from the response
-        embedding = response.embeddings.float[0]  # Get first (and only) embedding
+    if not settings.local_embedding_model_dir:
+        raise ValueError("LOCAL_EMBEDDING_MODEL_DIR environment variable not set")
+    model_dir = Path(settings.local_embedding_model_dir)
 
-        print(f"[AI Service] Cohere returned embedding with {len(embedding)} dimensions")
+    # Uses CUDA when onnxruntime-gpu is installed, otherwise the CPU
+    session = onnxruntime.InferenceSession(
+        str(model_dir / "model.onnx"),
+        providers=onnxruntime.get_available_providers()
+    )
+    tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+    tokenizer.enable_truncation(EMBEDDING_MAX_TOKENS)
+    tokenizer.enable_padding()
+    input_names = {model_input.name for model_input in session.get_inputs()}
+    logger.info("Loaded local embedding model from %s", model_dir)
+    return session, tokenizer, input_names
 
-        # Truncate to 768 dimensions (Cohere returns 1024)
-        if len(embedding) > EMBEDDING_DIMENSIONS:
-            print(f"[AI Service] Truncating from {len(embedding)} to {EMBEDDING_DIMENSIONS} dimensions")
-            embedding = embedding[:EMBEDDING_DIMENSIONS]
-        elif len(embedding) < EMBEDDING_DIMENSIONS:
-            print(f"[AI Service] Warning: Embedding has only {len(embedding)} dimensions, expected {EMBEDDING_DIMENSIONS}")
-            # Pad with zeros if needed
-            embedding.extend([0.0] * (EMBEDDING_DIMENSIONS - len(embedding)))
 
-        print(f"[AI Service] Successfully generated {len(embedding)}-dimensional embedding")
-        return embedding
+def local_embed(texts: List[str], query: bool = False) -> np.ndarray:
+    """
+    Embed texts with the local ONNX model (blocking; run it in a worker thread).
+    Returns float32 CLS vectors truncated to 768 dimensions, not normalized.
+    """
+    session, tokenizer, input_names = _get_local_embedder()
+    if query:
+        texts = [LOCAL_QUERY_INSTRUCTION + text for text in texts]
+
+    encodings = tokenizer.encode_batch(texts)
+    input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+    inputs = {
+        "input_ids": input_ids,
+        "attention_mask": np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+    }
+    if "token_type_ids" in input_names:
+        inputs["token_type_ids"] = np.zeros_like(input_ids)
+
+    hidden_states = session.run(None, inputs)[0]
+    return np.ascontiguousarray(hidden_states[:, 0, :EMBEDDING_DIMENSIONS], dtype=np.float32)
+
+
+async def get_embeddings_batch(texts: List[str]) -> np.ndarray:
+    """
+    Get embedding vectors for many texts with as few Cohere API calls as possible
+    (or with the local model when settings.embedding_backend is "onnx").
+    Texts are packed into requests by _plan_embedding_batches and the requests
+    are sent concurrently (at most settings.embedding_max_inflight at a time).
+
+    Texts embedded before are served from _embedding_cache, and texts repeated
+    within the call are embedded once. While the tokenizer is still loading,
+    texts are cut by a length estimate instead, and those vectors aren't cached.
+
+    Returns a float32 array of shape (len(texts), 768), rows in input order and
+    normalized to unit length (so cosine similarity is a dot product).
+    """
+    use_local_model = settings.embedding_backend == "onnx"
+    if not COHERE_API_KEY and not use_local_model:
+        raise ValueError("COHERE_API_KEY environment variable not set")
 
+    if not texts:
+        return np.empty((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+
+    output = np.empty((len(texts), EMBEDDING_DIMENSIONS), dtype=np.float32)
+    keys = [_embedding_cache_key(text) for text in texts]
+    missing = {}  # cache key -> first text with that key
+    for row, (key, text) in enumerate(zip(keys, texts)):
+        cached = _embedding_cache.get(key)
+        if cached is not None:
+            output[row] = cached
+        else:
+            missing.setdefault(key, text)
+
+    logger.debug("Embedding cache hits: %d of %d texts", len(texts) - len(missing), len(texts))
+    if not missing:
+        return output
+
+    # Checked before truncating: once loaded, the tokenizer stays loaded
+    cacheable = _get_tokenizer() is not None
+    texts = [truncate_for_embedding(text) for text in missing.values()]
+    batches = _plan_embedding_batches(texts)
+    logger.debug("Requesting embeddings for %d texts in %d requests", len(texts), len(batches))
+
+    # Rows are filled in place; shorter embeddings stay zero-padded to 768 dimensions
+    result = np.zeros((len(texts), EMBEDDING_DIMENSIONS), dtype=np.float32)
+
+    async def embed_batch(indices: List[int]):
+        async with _embedding_request_semaphore:
+            if use_local_model:
+                vectors = await asyncio.to_thread(local_embed, [texts[i] for i in indices])
+            else:
+                response = await _cohere_embed([texts[i] for i in indices])
+                vectors = np.asarray(response.embeddings.float, dtype=np.float32)
+
+        if len(vectors) != len(indices):
+            raise ValueError(f"expected {len(indices)} embeddings, got {len(vectors)}")
+
+        # Truncate to 768 dimensions (Cohere returns 1024)
+        width = min(vectors.shape[1], EMBEDDING_DIMENSIONS)
+        result[indices, :width] = vectors[:, :width]
+
+    try:
+        await asyncio.gather(*(embed_batch(indices) for indices in batches))
     except Exception as e:
-        print(f"[AI Service] Error generating embedding: {type(e).__name__}: {e}")
-        raise Exception(f"Cohere embedding generation failed: {str(e)}")
+        logger.error("Error generating embeddings: %s: %s", type(e).__name__, e)
+        raise Exception(f"{'Local' if use_local_model else 'Cohere'} embedding generation failed: {str(e)}")
+
+    # Truncated vectors are no longer unit length; normalize once here
+    norms = np.linalg.norm(result, axis=1, keepdims=True)
+    np.divide(result, norms, out=result, where=norms > 0)
+    logger.debug("Successfully generated %d embeddings", len(result))
 
+    # Cached rows are read-only copies, so callers can't alter them through the cache
+    fresh = {}
+    for key, embedding in zip(missing, result):
+        cached = embedding.copy()
+        cached.flags.writeable = False
+        fresh[key] = cached
+        if cacheable:
+            _embedding_cache[key] = cached
+    for row, key in enumerate(keys):
+        if key in fresh:
+            output[row] = fresh[key]
+    return output
 
-async def generate_text(prompt: str, max_tokens: int = 100, temperature: float = 0.1) -> str:
+
+async def generate_text(
+    prompt: str,
+    max_tokens: int = 100,
+    temperature: float = 0.1,
+    system: Optional[str] = None
+) -> str:
     """
     Generate text using Groq LLM API.
+    A fixed system instruction goes in its own message ahead of the prompt so
+    providers with prefix caching can reuse it across calls.
     """
     if not GROQ_API_KEY:
         raise ValueError("GROQ_API_KEY environment variable not set")
 
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
-            GROQ_URL,
-            headers={
-                "Authorization": f"Bearer {GROQ_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": LLM_MODEL,
-                "messages": [{"role": "user", "content": prompt}],
-                "max_tokens": max_tokens,
-                "temperature": temperature
-            }
-        )
+    messages = [{"role": "user", "content": prompt}]
+    if system:
+        messages.insert(0, {"role": "system", "content": system})
+
+    response = await groq_chat_completion({
+        "model": LLM_MODEL,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": temperature
+    })
 
-        if response.status_code != 200:
-            raise Exception(f"Groq API error: {response.status_code} - {response.text}")
+    if response.status_code != 200:
+        raise Exception(f"Groq API error: {response.status_code} - {response.text}")
 
-        result = response.json()
-        return result["choices"][0]["message"]["content"].strip()
+    result = orjson.loads(response.content)
+    return result["choices"][0]["message"]["content"].strip()
 
 
-async def extract_job_title(cv_content: str) -> str:
+def content_hash(text: str) -> str:
+    """
+    Get a short, stable hash of text for use as a cache key.
+    """
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _load_tokenizer():
+    global _tokenizer, _tokenizer_loading
+    try:
+        _tokenizer = tiktoken.get_encoding("cl100k_base")
+        logger.info("Tokenizer loaded")
+    except Exception as e:
+        logger.warning("Tokenizer unavailable, estimating tokens from length: %s: %s", type(e).__name__, e)
+    finally:
+        _tokenizer_loading = False
+
+
+def start_tokenizer_load():
+    """
+    Load the cl100k_base encoding in a background thread. The first load may
+    download the BPE file (a blocking request without a timeout; set
+    TIKTOKEN_CACHE_DIR to a vendored copy to avoid it), so it never runs on
+    the event loop. After a failure it is retried at most every
+    TOKENIZER_RETRY_SECONDS.
+    """
+    global _tokenizer_loading, _tokenizer_next_attempt
+    with _tokenizer_lock:
+        if _tokenizer is not None or _tokenizer_loading or time.monotonic() < _tokenizer_next_attempt:
+            return
+        _tokenizer_loading = True
+        _tokenizer_next_attempt = time.monotonic() + TOKENIZER_RETRY_SECONDS
+    threading.Thread(target=_load_tokenizer, name="tiktoken-load", daemon=True).start()
+
+
+def _get_tokenizer() -> Optional["tiktoken.Encoding"]:
+    """
+    The cl100k_base encoding, or None while it isn't loaded (callers then
+    estimate from length). Never blocks: a missing tokenizer is (re)loaded in
+    the background.
+    """
+    if _tokenizer is None:
+        start_tokenizer_load()
+    return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens in text. cl100k_base closely approximates the Llama 3 tokenizer.
+    """
+    tokenizer = _get_tokenizer()
+    if tokenizer is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(tokenizer.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Truncate text to at most max_tokens tokens, cutting on a token boundary.
+    """
+    if max_tokens <= 0:
+        return ""
+
+    tokenizer = _get_tokenizer()
+    if tokenizer is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+
+    tokens = tokenizer.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return tokenizer.decode(tokens[:max_tokens])
+
+
+def truncate_for_embedding(text: str) -> str:
+    """
+    Cut text to what the embedding model actually reads (EMBEDDING_MAX_TOKENS),
+    so longer texts aren't sent.
+    """
+    # Bound the tokenizer's work on very long documents first
+    return truncate_to_tokens(text[:EMBEDDING_INPUT_CHARS], EMBEDDING_MAX_TOKENS)
+
+
+def _embedding_cache_key(text: str) -> str:
+    # Hashes the characters truncate_for_embedding starts from, so computing a key
+    # never runs the tokenizer (only cache misses are tokenized)
+    return content_hash(text[:EMBEDDING_INPUT_CHARS])
+
+
+class SemanticCache:
+    """
+    Fixed-size cache keyed by embedding vectors. A lookup returns the value stored
+    for the most similar cached vector if its cosine similarity reaches the
+    threshold; once full, the oldest entries are overwritten first.
+
+    Vectors are stored as int8 with a per-vector scale (a quarter of the float32
+    memory); the quantization error on cosine scores is far below the thresholds used.
+    """
+
+    def __init__(self, maxsize: int, dimensions: int = EMBEDDING_DIMENSIONS):
+        self._vectors = np.zeros((maxsize, dimensions), dtype=np.int8)
+        self._scales = np.ones(maxsize, dtype=np.float32)
+        self._values: List[Optional[str]] = [None] * maxsize
+        self._size = 0
+        self._next = 0
+
+    def _quantize(self, vector: Sequence[float]) -> Optional[Tuple[np.ndarray, float]]:
+        """Normalize to unit length and map to int8; returns (int8 vector, scale) or None for zero vectors"""
+        vector = np.asarray(vector, dtype=np.float32)[:self._vectors.shape[1]]
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None
+        vector = vector / norm
+        scale = 127.0 / float(np.abs(vector).max())
+        return np.round(vector * scale).astype(np.int8), scale
+
+    def get(self, vector: Sequence[float], threshold: float) -> Optional[str]:
+        quantized = self._quantize(vector)
+        if quantized is None or not self._size:
+            return None
+        query, query_scale = quantized
+
+        # Integer dot products (accumulated in int32) against every cached entry,
+        # then undo both scales to get cosine similarities
+        dots = np.matmul(self._vectors[:self._size], query, dtype=np.int32)
+        scores = dots / (self._scales[:self._size] * query_scale)
+        best = int(np.argmax(scores))
+        return self._values[best] if scores[best] >= threshold else None
+
+    def put(self, vector: Sequence[float], value: str):
+        quantized = self._quantize(vector)
+        if quantized is None:
+            return
+
+        self._vectors[self._next], self._scales[self._next] = quantized
+        self._values[self._next] = value
+        self._next = (self._next + 1) % len(self._values)
+        self._size = min(self._size + 1, len(self._values))
+
+
+# Extracted job titles keyed by resume embedding, so near-identical CVs
+# (re-exports, small edits) reuse a title
+_job_title_semantic_cache = SemanticCache(maxsize=1024)
+
+
+async def extract_job_title(cv_content: str, cv_embedding: Optional[Sequence[float]] = None) -> str:
     """
     Extract the most relevant job title from CV content using LLM.
+    Results are cached per CV excerpt and, when cv_embedding is given, per
+    resume embedding, so unchanged or near-identical CVs skip the LLM call.
     """
-    prompt = f"""Based on this CV/resume content, what is the most relevant job title this person should search for?
-Return ONLY the job title (2-4 words max), nothing else. For example: "Software Engineer" or "Data Analyst" or "Product Manager" or "Marketing Specialist".
+    cv_excerpt = cv_content[:JOB_TITLE_CONTEXT_CHARS]
+
+    # Empty or unparsed documents: don't spend an LLM round-trip on them
+    if len(cv_excerpt.strip()) < MIN_CV_CHARS:
+        logger.debug("CV content too short, using default job title")
+        return DEFAULT_JOB_TITLE
+
+    cache_key = content_hash(cv_excerpt)
 
-CV Content:
-{cv_content[:3000]}
+    cached_title = _job_title_cache.get(cache_key)
+    if cached_title is None and cv_embedding is not None:
+        cached_title = _job_title_semantic_cache.get(cv_embedding, JOB_TITLE_SIMILARITY_THRESHOLD)
+    if cached_title is None and cv_embedding is not None and _groq_breaker.is_open:
+        # The LLM call would fail fast anyway; a close-enough resume's title beats the default
+        cached_title = _job_title_semantic_cache.get(cv_embedding, JOB_TITLE_DEGRADED_SIMILARITY_THRESHOLD)
+    if cached_title is not None:
+        logger.debug("Using cached job title: %r", cached_title)
+        return cached_title
+
+    prompt = f"""CV Content:
+{cv_excerpt}
 
 Job title:"""
 
     try:
-        answer = await generate_text(prompt, max_tokens=20, temperature=0.1)
-
-        # Clean up response
-        answer = answer.split('\n')[0].strip('"\'').strip()
+        answer = await generate_text(prompt, max_tokens=20, temperature=0.1, system=JOB_TITLE_INSTRUCTION)
 
-        # Remove common prefixes
-        if answer.lower().startswith(("based on", "the ", "a ")):
-            parts = answer.split(":")
-            if len(parts) > 1:
-                answer = parts[-1].strip()
+        # Clean up response: first line only, without quotes or a leading explanation
+        answer = answer.partition('\n')[0].strip('"\'').strip()
+        match = _JOB_TITLE_PREFIX_RE.match(answer)
+        if match:
+            answer = match.group("title").strip()
 
-        print(f"[AI Service] Extracted job title: '{answer}'")
-        return answer if answer and len(answer) < 50 else "general"
+        logger.debug("Extracted job title: %r", answer)
+        title = answer if answer and len(answer) < 50 else DEFAULT_JOB_TITLE
+        _job_title_cache[cache_key] = title
+        if cv_embedding is not None:
+            _job_title_semantic_cache.put(cv_embedding, title)
+        return title
 
     except Exception as e:
-        print(f"[AI Service] Failed to extract job title: {e}")
-        return "general"
+        logger.warning("Failed to extract job title: %s", e)
+        return DEFAULT_JOB_TITLE
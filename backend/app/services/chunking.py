@@ -0,0 +1,77 @@
+from typing import List
+import hashlib
+
+import numpy as np
+
+CHUNK_SIZE = 1000  # characters per chunk
+CHUNK_OVERLAP = 200  # characters shared by consecutive chunks
+
+
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """
+    Split text into overlapping chunks of at most chunk_size characters.
+    Chunk ends are moved back to the last whitespace (if there is one in the
+    second half of the window) so words aren't cut in half.
+    """
+    if overlap >= chunk_size // 2:
+        raise ValueError("overlap must be less than half of chunk_size")
+
+    text = text.strip()
+    chunks = []
+    start = 0
+
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            boundary = max(
+                text.rfind(" ", start + chunk_size // 2, end),
+                text.rfind("\n", start + chunk_size // 2, end)
+            )
+            if boundary != -1:
+                end = boundary
+
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+
+        if end >= len(text):
+            break
+        start = end - overlap
+
+    return chunks
+
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash of the text's word trigrams. Texts that differ in a few words
+    (page numbers, headers) get hashes only a few bits apart.
+    """
+    words = text.lower().split()
+    shingles = [" ".join(words[i:i + 3]) for i in range(max(len(words) - 2, 1))]
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little") for s in shingles],
+        dtype=np.uint64
+    )
+    # Each bit is set when most shingle hashes have it set
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    majority = bits.sum(axis=0) * 2 > len(shingles)
+    return int.from_bytes(np.packbits(majority, bitorder="little").tobytes(), "little")
+
+
+def near_duplicate_indices(texts: List[str], max_distance: int = 3) -> List[int]:
+    """
+    For each text, the index of the first earlier text whose SimHash is within
+    max_distance bits of it, or its own index if there is none.
+    """
+    hashes = [simhash(text) for text in texts]
+    representatives: List[int] = []
+    result = []
+    for index, value in enumerate(hashes):
+        match = next(
+            (rep for rep in representatives if (hashes[rep] ^ value).bit_count() <= max_distance),
+            index
+        )
+        if match == index:
+            representatives.append(index)
+        result.append(match)
+    return result
@@ -1,37 +1,109 @@
 from pathlib import Path
+from typing import BinaryIO, Optional, Tuple
 from uuid import UUID, uuid4
 from fastapi import UploadFile, HTTPException
-import aiofiles
+import asyncio
+import hashlib
+import io
 import os
+import shutil
+import stat
 
-async def save_uploaded_file(user_id: UUID, file: UploadFile, upload_dir: str = "uploads") -> dict:
+# Bytes per sendfile / copy call
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Starlette keeps uploads up to this size in memory and spools larger ones to disk
+UPLOAD_SPOOL_MAX_SIZE = 1024 * 1024
+
+# Stored file paths are relative to the working directory, which doesn't change at runtime
+_BASE_DIR = os.path.realpath(os.getcwd())
+
+
+def _copy_upload(source: BinaryIO, file_path: Path) -> Tuple[int, bytes]:
+    """
+    Hash the spooled upload and copy it to file_path. Returns (size, digest).
+    Blocking; save_uploaded_file runs it in a worker thread.
+    """
+    source.seek(0)
+    digest = hashlib.file_digest(source, lambda: hashlib.blake2b(digest_size=16)).digest()
+    size = source.tell()
+    source.seek(0)
+
+    try:
+        destination = open(file_path, "wb")
+    except FileNotFoundError:
+        # Only the first upload for a user pays for the mkdir
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        destination = open(file_path, "wb")
+
+    with destination:
+        # Uploads Starlette has spooled to a temp file are copied in the kernel; small
+        # ones are still in memory (fileno() would force them to disk first), and
+        # sources without a descriptor or filesystems without sendfile use a plain copy
+        if size > UPLOAD_SPOOL_MAX_SIZE:
+            try:
+                source_fd = source.fileno()
+                offset = 0
+                while sent := os.sendfile(destination.fileno(), source_fd, offset, COPY_CHUNK_SIZE):
+                    offset += sent
+                return offset, digest
+            except (io.UnsupportedOperation, AttributeError, OSError):
+                source.seek(0)
+                destination.seek(0)
+                destination.truncate()
+
+        shutil.copyfileobj(source, destination, COPY_CHUNK_SIZE)
+        return destination.tell(), digest
+
+
+def _file_too_large(max_size: int) -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail=f"File size exceeds maximum allowed size of {max_size / (1024 * 1024)}MB"
+    )
+
+
+async def save_uploaded_file(
+    user_id: UUID,
+    file: UploadFile,
+    upload_dir: str = "uploads",
+    max_size: Optional[int] = None
+) -> dict:
     """
-    Save uploaded file to disk and return file metadata.
+    Copy an uploaded file to disk and return file metadata.
+    The upload is already spooled by Starlette, so it is copied file-to-file
+    (sendfile where possible) instead of being read through Python in chunks.
+    The bytes are hashed as well so duplicate uploads can be detected.
 
     Args:
         user_id: UUID of the user uploading the file
         file: UploadFile object from FastAPI
         upload_dir: Base directory for uploads (default: "uploads")
+        max_size: Maximum allowed file size in bytes (default: unlimited)
 
     Returns:
-        dict with file_path, original_filename, file_size, mime_type
+        dict with file_path, original_filename, file_size, mime_type and
+        content_hash (16-byte BLAKE2b digest of the file)
+
+    Raises:
+        HTTPException 400 if the file exceeds max_size, 500 if saving fails
     """
-    # Create user-specific directory
+    # The spooled size is known up front: reject oversized files before copying anything
+    if max_size is not None and file.size is not None and file.size > max_size:
+        raise _file_too_large(max_size)
+
+    # User-specific directory (created on the user's first upload)
     user_dir = Path(upload_dir) / str(user_id)
-    user_dir.mkdir(parents=True, exist_ok=True)
 
     # Generate unique filename
     file_extension = Path(file.filename).suffix
     unique_filename = f"{uuid4()}{file_extension}"
     file_path = user_dir / unique_filename
 
-    # Save file in chunks
     try:
-        file_size = 0
-        async with aiofiles.open(file_path, 'wb') as f:
-            while chunk := await file.read(1024 * 1024):  # 1MB chunks
-                await f.write(chunk)
-                file_size += len(chunk)
+        file_size, digest = await asyncio.to_thread(_copy_upload, file.file, file_path)
+        if max_size is not None and file_size > max_size:
+            raise _file_too_large(max_size)
 
         # Return relative path (from backend directory)
         relative_path = str(file_path)
@@ -40,12 +112,15 @@ async def save_uploaded_file(user_id: UUID, file: UploadFile, upload_dir: str =
             "file_path": relative_path,
             "original_filename": file.filename,
             "file_size": file_size,
-            "mime_type": file.content_type
+            "mime_type": file.content_type,
+            "content_hash": digest
         }
     except Exception as e:
         # Clean up partial file if upload failed
         if file_path.exists():
             file_path.unlink()
+        if isinstance(e, HTTPException):
+            raise
         raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
 
 
@@ -82,18 +157,39 @@ def get_file_path(file_path: str) -> Path:
     Raises:
         HTTPException if path is invalid or outside allowed directory
     """
+    return get_file_stat(file_path)[0]
+
+
+def get_file_stat(file_path: str) -> Tuple[Path, os.stat_result]:
+    """
+    Get absolute path and stat result for a file with security validation.
+    The file is stat'ed exactly once, so the result can be handed to
+    FileResponse instead of letting it stat the file again.
+
+    Args:
+        file_path: Relative path to the file
+
+    Returns:
+        Tuple of absolute Path object and its os.stat_result
+
+    Raises:
+        HTTPException if path is invalid, outside allowed directory or missing
+    """
     try:
-        base_dir = Path.cwd()
-        full_path = (base_dir / file_path).resolve()
+        full_path = os.path.realpath(os.path.join(_BASE_DIR, file_path))
 
-        # Prevent path traversal attacks
-        if not str(full_path).startswith(str(base_dir)):
+        # Prevent path traversal attacks (a plain prefix check would accept e.g. /app-other)
+        if os.path.commonpath([_BASE_DIR, full_path]) != _BASE_DIR:
             raise HTTPException(status_code=400, detail="Invalid file path")
 
-        if not full_path.exists():
+        try:
+            stat_result = os.stat(full_path)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="File not found")
+        if not stat.S_ISREG(stat_result.st_mode):
             raise HTTPException(status_code=404, detail="File not found")
 
-        return full_path
+        return Path(full_path), stat_result
     except HTTPException:
         raise
     except Exception as e:
@@ -1,5 +1,81 @@
-from pypdf import PdfReader
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+import asyncio
+import multiprocessing
+import os
+
+import pypdfium2 as pdfium
+
+# Placeholder texts stored when extraction fails (here or in the upload endpoints)
+EXTRACTION_FAILED_PREFIXES = ("[PDF text extraction failed:", "[Text extraction failed:")
+
+# PDFs with at most this many pages are extracted in a single worker thread;
+# larger ones are split into page ranges across the process pool
+PAGES_PER_TASK = 16
+
+# PDFium is not thread-safe, so every extraction runs in a single-threaded worker process
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """
+    Get the process pool for PDF extraction, starting it on first use.
+    Workers come from a forkserver so they don't inherit the server's threads.
+    """
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = ProcessPoolExecutor(
+            max_workers=os.cpu_count(),
+            mp_context=multiprocessing.get_context("forkserver")
+        )
+    return _pdf_pool
+
+
+def shutdown_pdf_pool():
+    """
+    Stop the PDF extraction workers (called on application shutdown).
+    """
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(cancel_futures=True)
+        _pdf_pool = None
+
+
+def extraction_failed(text: str) -> bool:
+    """True if text is a failure placeholder rather than extracted content"""
+    return text.startswith(EXTRACTION_FAILED_PREFIXES)
+
+
+def _page_text(pdf: pdfium.PdfDocument, index: int) -> str:
+    """Extract the text of one page, releasing PDFium's page handles afterwards"""
+    page = pdf[index]
+    try:
+        textpage = page.get_textpage()
+        try:
+            return textpage.get_text_range()
+        finally:
+            textpage.close()
+    finally:
+        page.close()
+
+
+def _count_pages(file_path: str) -> int:
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def _extract_pages(file_path: str, start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop); PDFium only parses the pages it loads"""
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        return [_page_text(pdf, index) for index in range(start, stop)]
+    finally:
+        pdf.close()
 
 
 def extract_text_from_pdf(file_path: str) -> str:
@@ -19,14 +95,17 @@ def extract_text_from_pdf(file_path: str) -> str:
         # Convert to Path object for handling
         path = Path(file_path)
 
-        # Read PDF and extract text from all pages
-        reader = PdfReader(str(path))
-        text_parts = []
+        # Read PDF and extract text from all pages (parsed in C++ by PDFium)
+        pdf = pdfium.PdfDocument(str(path))
+        try:
+            text_parts = []
 
-        for page in reader.pages:
-            text = page.extract_text()
-            if text:
-                text_parts.append(text)
+            for index in range(len(pdf)):
+                text = _page_text(pdf, index)
+                if text:
+                    text_parts.append(text)
+        finally:
+            pdf.close()
 
         # Concatenate all page texts with newline separators
         full_text = "\n\n".join(text_parts)
@@ -37,3 +116,53 @@ def extract_text_from_pdf(file_path: str) -> str:
         # Return error message instead of raising exception
         # This allows the document to be saved even if extraction fails
         return f"[PDF text extraction failed: {str(e)}]"
+
+
+def _reset_pdf_pool(broken_pool: ProcessPoolExecutor):
+    """Discard a pool whose worker died, unless another caller already replaced it"""
+    global _pdf_pool
+    if _pdf_pool is broken_pool:
+        _pdf_pool = None
+    broken_pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def _extract_in_pool(pool: ProcessPoolExecutor, file_path: str) -> str:
+    loop = asyncio.get_running_loop()
+    page_count = await loop.run_in_executor(pool, _count_pages, file_path)
+    if page_count <= PAGES_PER_TASK:
+        return await loop.run_in_executor(pool, extract_text_from_pdf, file_path)
+
+    pages_per_task = max(PAGES_PER_TASK, -(-page_count // (os.cpu_count() or 1)))
+    results = await asyncio.gather(*(
+        loop.run_in_executor(pool, _extract_pages, file_path, start, min(start + pages_per_task, page_count))
+        for start in range(0, page_count, pages_per_task)
+    ))
+
+    # Concatenate all page texts with newline separators
+    text_parts = [text for pages in results for text in pages if text]
+    return "\n\n".join(text_parts).strip()
+
+
+async def extract_text_from_pdf_async(file_path: str) -> str:
+    """
+    Extract text content from a PDF file without blocking the event loop.
+    Same result as extract_text_from_pdf; large PDFs are extracted in parallel
+    page ranges (one per CPU) in worker processes.
+
+    A worker crash (e.g. PDFium segfault, OOM kill) breaks the whole pool; it is
+    replaced and the extraction retried once, so later uploads aren't affected.
+    """
+    try:
+        for attempt in range(2):
+            pool = _get_pdf_pool()
+            try:
+                return await _extract_in_pool(pool, file_path)
+            except BrokenProcessPool:
+                _reset_pdf_pool(pool)
+                if attempt == 1:
+                    raise
+
+    except Exception as e:
+        # Return error message instead of raising exception
+        # This allows the document to be saved even if extraction fails
+        return f"[PDF text extraction failed: {str(e)}]"
@@ -0,0 +1,215 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+import pytest
+from tenacity import wait_none
+
+from app.services import ai
+
+
+def test_semantic_cache_matches_similar_vectors():
+    cache = ai.SemanticCache(maxsize=4, dimensions=3)
+    cache.put([1.0, 0.0, 0.0], "engineer")
+
+    assert cache.get([0.99, 0.05, 0.0], threshold=0.97) == "engineer"
+    assert cache.get([0.0, 1.0, 0.0], threshold=0.97) is None
+    assert cache.get([0.0, 0.0, 0.0], threshold=0.97) is None
+
+
+def test_semantic_cache_evicts_oldest_entry():
+    cache = ai.SemanticCache(maxsize=2, dimensions=3)
+    cache.put([1.0, 0.0, 0.0], "first")
+    cache.put([0.0, 1.0, 0.0], "second")
+    cache.put([0.0, 0.0, 1.0], "third")
+
+    assert cache.get([1.0, 0.0, 0.0], threshold=0.97) is None
+    assert cache.get([0.0, 1.0, 0.0], threshold=0.97) == "second"
+    assert cache.get([0.0, 0.0, 1.0], threshold=0.97) == "third"
+
+
+def test_plan_embedding_batches_respects_limits():
+    texts = ["x" * 30_000] * 5 + ["y"] * 200
+    batches = ai._plan_embedding_batches(texts)
+
+    assert sorted(i for batch in batches for i in batch) == list(range(len(texts)))
+    for batch in batches:
+        assert len(batch) <= ai.EMBEDDING_BATCH_SIZE
+        assert sum(len(texts[i]) for i in batch) <= ai.EMBEDDING_BATCH_MAX_CHARS
+
+
+def test_plan_embedding_batches_oversized_text_gets_own_batch():
+    texts = ["a", "b" * (ai.EMBEDDING_BATCH_MAX_CHARS + 1)]
+    assert ai._plan_embedding_batches(texts) == [[1], [0]]
+
+
+def test_job_title_prefix_cleanup():
+    match = ai._JOB_TITLE_PREFIX_RE.match('Based on the CV, the job title is: "Data Analyst"')
+    assert match.group("title") == "Data Analyst"
+    assert ai._JOB_TITLE_PREFIX_RE.match("Software Engineer") is None
+
+
+def test_circuit_breaker_opens_and_resets(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ai.time, "monotonic", lambda: now[0])
+    breaker = ai.CircuitBreaker("Test", window=10, min_calls=4, reset_seconds=30)
+
+    for _ in range(3):
+        breaker.record(False)
+    assert not breaker.is_open  # Too few calls to judge
+
+    breaker.record(False)
+    assert breaker.is_open
+    with pytest.raises(ai.CircuitOpenError):
+        breaker.check()
+
+    now[0] += 30
+    assert not breaker.is_open
+    breaker.check()
+
+
+def test_circuit_breaker_stays_closed_below_failure_ratio():
+    breaker = ai.CircuitBreaker("Test", window=10, min_calls=4)
+    for success in (True, False, True, False, True, True):
+        breaker.record(success)
+    assert not breaker.is_open
+
+
+def test_get_embedding_failure_reaches_every_caller(monkeypatch):
+    async def failing_batch(texts):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("provider down")
+
+    monkeypatch.setattr(ai, "get_embeddings_batch", failing_batch)
+    monkeypatch.setattr(ai, "_embedding_cache", ai.LRUCache(maxsize=100))
+
+    async def scenario():
+        return await asyncio.gather(*(ai.get_embedding("text") for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert ai._embedding_inflight == {}
+
+
+def test_get_embedding_survives_first_caller_cancellation(monkeypatch):
+    calls = []
+
+    async def fake_batch(texts):
+        calls.append(texts)
+        await asyncio.sleep(0.05)
+        unit = np.ones(ai.EMBEDDING_DIMENSIONS, dtype=np.float32)
+        return np.stack([unit / np.linalg.norm(unit)] * len(texts))
+
+    monkeypatch.setattr(ai, "get_embeddings_batch", fake_batch)
+    monkeypatch.setattr(ai, "_embedding_cache", ai.LRUCache(maxsize=100))
+
+    async def scenario():
+        first = asyncio.ensure_future(ai.get_embedding("same text"))
+        await asyncio.sleep(0)
+        others = [asyncio.ensure_future(ai.get_embedding("same text")) for _ in range(3)]
+        await asyncio.sleep(0)
+        first.cancel()
+        results = await asyncio.gather(*others)
+        return first, results
+
+    first, results = asyncio.run(scenario())
+
+    assert first.cancelled()
+    assert len(calls) == 1
+    assert all(result.shape == (ai.EMBEDDING_DIMENSIONS,) for result in results)
+    assert ai._embedding_inflight == {}
+
+
+class CharTokenizer:
+    """One token per character"""
+
+    def encode(self, text, disallowed_special=()):
+        return list(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+def test_get_embeddings_batch_uses_cache_and_dedupes(monkeypatch):
+    sent = []
+
+    async def fake_embed(texts):
+        sent.append(list(texts))
+        return SimpleNamespace(embeddings=SimpleNamespace(float=[[len(t), 1.0] + [0.0] * 1022 for t in texts]))
+
+    monkeypatch.setattr(ai, "COHERE_API_KEY", "test")
+    monkeypatch.setattr(ai, "_cohere_embed", fake_embed)
+    monkeypatch.setattr(ai, "_embedding_cache", ai.LRUCache(maxsize=100))
+    monkeypatch.setattr(ai, "_tokenizer", CharTokenizer())
+
+    first = asyncio.run(ai.get_embeddings_batch(["aa", "bbb", "aa"]))
+    second = asyncio.run(ai.get_embeddings_batch(["bbb", "c"]))
+
+    assert sent == [["bbb", "aa"], ["c"]]
+    np.testing.assert_allclose(first[0], first[2])
+    np.testing.assert_allclose(first[1], second[0])
+    np.testing.assert_allclose(np.linalg.norm(second, axis=1), 1.0, rtol=1e-5)
+
+
+def test_cohere_retries_count_once_against_the_breaker(monkeypatch):
+    input_types = []
+
+    class FailingClient:
+        async def embed(self, **kwargs):
+            input_types.append(kwargs["input_type"])
+            raise httpx.ConnectError("connection refused")
+
+    breaker = ai.CircuitBreaker("Test")
+    monkeypatch.setattr(ai, "COHERE_API_KEY", "test")
+    monkeypatch.setattr(ai, "_cohere_breaker", breaker)
+    monkeypatch.setattr(ai, "get_cohere_async_client", FailingClient)
+    monkeypatch.setattr(ai._cohere_embed_with_retry.retry, "wait", wait_none())
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(ai.embed_query("python developer"))
+
+    assert input_types == ["search_query"] * 5
+    assert list(breaker._results) == [False]
+
+
+def test_groq_retries_count_once_against_the_breaker(monkeypatch):
+    attempts = []
+
+    class UnavailableClient:
+        async def post(self, url, **kwargs):
+            attempts.append(url)
+            return httpx.Response(503)
+
+    breaker = ai.CircuitBreaker("Test")
+    monkeypatch.setattr(ai, "_groq_breaker", breaker)
+    monkeypatch.setattr(ai, "get_http_client", UnavailableClient)
+    monkeypatch.setattr(ai._groq_post_with_retry.retry, "wait", wait_none())
+
+    response = asyncio.run(ai.groq_chat_completion({"messages": []}))
+
+    assert response.status_code == 503
+    assert len(attempts) == 5
+    assert list(breaker._results) == [False]
+
+
+def test_get_embeddings_batch_skips_cache_without_tokenizer(monkeypatch):
+    sent = []
+
+    async def fake_embed(texts):
+        sent.append(list(texts))
+        return SimpleNamespace(embeddings=SimpleNamespace(float=[[1.0] * 1024 for _ in texts]))
+
+    monkeypatch.setattr(ai, "COHERE_API_KEY", "test")
+    monkeypatch.setattr(ai, "_cohere_embed", fake_embed)
+    monkeypatch.setattr(ai, "_embedding_cache", ai.LRUCache(maxsize=100))
+    monkeypatch.setattr(ai, "_tokenizer", None)
+    monkeypatch.setattr(ai, "start_tokenizer_load", lambda: None)
+
+    long_text = "word " * 2000
+    asyncio.run(ai.get_embeddings_batch([long_text]))
+    asyncio.run(ai.get_embeddings_batch([long_text]))
+
+    # Cut to the length estimate both times, and never cached
+    assert sent == [[long_text[:ai.EMBEDDING_MAX_TOKENS * ai.CHARS_PER_TOKEN]]] * 2
+    assert len(ai._embedding_cache) == 0
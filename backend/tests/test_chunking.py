@@ -0,0 +1,46 @@
+import pytest
+
+from app.services.chunking import chunk_text, near_duplicate_indices, simhash
+
+
+def test_chunk_text_short_text_is_one_chunk():
+    assert chunk_text("  hello world  ") == ["hello world"]
+
+
+def test_chunk_text_empty():
+    assert chunk_text("   ") == []
+
+
+def test_chunk_text_respects_size_and_word_boundaries():
+    words = [f"word{i}" for i in range(500)]
+    chunks = chunk_text(" ".join(words), chunk_size=100, overlap=20)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    # Chunks end on a word boundary (starts may fall inside the overlap's first word)
+    assert all(chunk.split()[-1] in words for chunk in chunks)
+    # Every word ends up in some chunk
+    assert set(words) <= {token for chunk in chunks for token in chunk.split()}
+
+
+def test_chunk_text_rejects_large_overlap():
+    with pytest.raises(ValueError):
+        chunk_text("text", chunk_size=100, overlap=50)
+
+
+def test_simhash_is_stable_and_close_for_small_edits():
+    text = " ".join(f"word{i}" for i in range(200))
+    edited = text.replace("word100", "changed")
+    other = " ".join(f"other{i}" for i in range(200))
+
+    assert simhash(text) == simhash(text)
+    assert (simhash(text) ^ simhash(edited)).bit_count() <= 3
+    assert (simhash(text) ^ simhash(other)).bit_count() > 3
+
+
+def test_near_duplicate_indices_points_to_first_occurrence():
+    a = " ".join(f"word{i}" for i in range(200))
+    b = " ".join(f"other{i}" for i in range(200))
+
+    assert near_duplicate_indices([a, b, a, a.replace("word150", "x")]) == [0, 1, 0, 0]
+    assert near_duplicate_indices([]) == []
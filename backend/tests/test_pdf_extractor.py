@@ -0,0 +1,47 @@
+import asyncio
+import os
+
+import pypdfium2 as pdfium
+
+from app.services import pdf_extractor
+
+
+def _blank_pdf(path, pages=1):
+    pdf = pdfium.PdfDocument.new()
+    for _ in range(pages):
+        pdf.new_page(612, 792)
+    pdf.save(str(path))
+    pdf.close()
+
+
+def test_extraction_failed_detects_placeholders():
+    assert pdf_extractor.extraction_failed("[PDF text extraction failed: bad xref]")
+    assert pdf_extractor.extraction_failed("[Text extraction failed: boom]")
+    assert not pdf_extractor.extraction_failed("[Summary] Experienced engineer")
+
+
+def test_missing_file_returns_failure_placeholder(tmp_path):
+    text = pdf_extractor.extract_text_from_pdf(str(tmp_path / "missing.pdf"))
+    assert pdf_extractor.extraction_failed(text)
+
+
+def test_async_extraction_recovers_from_broken_pool(tmp_path):
+    path = tmp_path / "blank.pdf"
+    _blank_pdf(path)
+
+    async def scenario():
+        # Kill a worker: the executor is now permanently broken
+        pool = pdf_extractor._get_pdf_pool()
+        try:
+            await asyncio.get_running_loop().run_in_executor(pool, os._exit, 1)
+        except Exception:
+            pass
+        text = await pdf_extractor.extract_text_from_pdf_async(str(path))
+        return pool, text
+
+    try:
+        broken_pool, text = asyncio.run(scenario())
+        assert not pdf_extractor.extraction_failed(text)
+        assert pdf_extractor._pdf_pool is not broken_pool
+    finally:
+        pdf_extractor.shutdown_pdf_pool()
@@ -0,0 +1,93 @@
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.routers import rag
+
+
+class FakeSession:
+    """Answers the RAG search statements from canned rows"""
+
+    def __init__(self, chunk_rows, document_rows):
+        self.results = {
+            rag.CHUNK_SEARCH_BY_USER_SQL: chunk_rows,
+            rag.DOCUMENT_SEARCH_BY_USER_SQL: document_rows,
+        }
+        self.texts = {
+            rag.CHUNK_CONTENT_SQL: "chunk text",
+            rag.DOCUMENT_CONTENT_SQL: "document text",
+        }
+
+    async def execute(self, statement, params):
+        if statement in self.texts:
+            rows = [(row_id, self.texts[statement]) for row_id in params["ids"]]
+        else:
+            rows = self.results[statement]
+        return SimpleNamespace(all=lambda: rows)
+
+
+def _chunk(document_id, filename, score):
+    return SimpleNamespace(id=uuid.uuid4(), document_id=document_id, original_filename=filename, similarity_score=score)
+
+
+def _document(filename, score):
+    return SimpleNamespace(id=uuid.uuid4(), original_filename=filename, similarity_score=score)
+
+
+def _search(session, top_k):
+    return asyncio.run(rag.search_documents(session, np.zeros(3, dtype=np.float32), "user", None, top_k))
+
+
+def test_search_keeps_best_chunk_per_document():
+    doc_a, doc_b = uuid.uuid4(), uuid.uuid4()
+    session = FakeSession(
+        [_chunk(doc_a, "a.pdf", 0.9), _chunk(doc_a, "a.pdf", 0.8), _chunk(doc_b, "b.pdf", 0.7)],
+        []
+    )
+
+    results = _search(session, top_k=5)
+
+    assert [(r.original_filename, r.similarity_score) for r in results] == [("a.pdf", 0.9), ("b.pdf", 0.7)]
+    assert all(r.content == "chunk text" for r in results)
+
+
+def test_search_ranks_unchunked_documents_with_chunk_hits():
+    doc_a, doc_b = uuid.uuid4(), uuid.uuid4()
+    session = FakeSession(
+        [_chunk(doc_a, "a.pdf", 0.9), _chunk(doc_b, "b.pdf", 0.5)],
+        [_document("old.pdf", 0.7), _document("older.pdf", 0.1)]
+    )
+
+    results = _search(session, top_k=3)
+
+    assert [(r.original_filename, r.content) for r in results] == [
+        ("a.pdf", "chunk text"),
+        ("old.pdf", "document text"),
+        ("b.pdf", "chunk text"),
+    ]
+
+
+def test_search_without_matches_returns_nothing():
+    assert _search(FakeSession([], []), top_k=5) == []
+
+
+def test_query_embeddings_are_cached(monkeypatch):
+    calls = []
+
+    async def fake_embed_query(query):
+        calls.append(query)
+        return np.ones(3, dtype=np.float32)
+
+    monkeypatch.setattr(rag, "embed_query", fake_embed_query)
+    monkeypatch.setattr(rag, "_query_embedding_cache", rag.LRUCache(maxsize=10))
+
+    async def scenario():
+        return [await rag._embed_query(rag.normalize_query(q)) for q in ("What is X?", " what is x? ")]
+
+    first, second = asyncio.run(scenario())
+
+    assert calls == ["what is x?"]
+    assert second is first
+    assert not first.flags.writeable
@@ -0,0 +1,114 @@
+import asyncio
+import uuid
+
+import numpy as np
+
+from app.database import async_engine
+from app.models import Document, DocumentChunk, User
+from app.routers import users
+from conftest import TEST_EMAIL_DOMAIN
+
+
+def _vector(seed):
+    return np.random.default_rng(seed).random(768, dtype=np.float32)
+
+
+def _user(db):
+    user = User(email=f"{uuid.uuid4().hex}@{TEST_EMAIL_DOMAIN}")
+    db.add(user)
+    db.flush()
+    return user
+
+
+def _document(db, user, content, content_hash=None, embedding=None):
+    document = Document(
+        user_id=user.id,
+        file_path="test.pdf",
+        original_filename="test.pdf",
+        content=content,
+        content_hash=content_hash,
+        embedding=embedding
+    )
+    db.add(document)
+    db.flush()
+    return document
+
+
+def test_find_duplicate_document_skips_failed_extractions(db):
+    digest = uuid.uuid4().bytes
+    owner, other = _user(db), _user(db)
+
+    _document(db, owner, "[PDF text extraction failed: bad xref]", digest)
+    assert users.find_duplicate_document(db, digest, owner.id) is None
+
+    shared = _document(db, other, "Resume text", digest)
+    assert users.find_duplicate_document(db, digest, owner.id).id == shared.id
+
+
+def test_find_duplicate_document_prefers_own_then_embedded_copy(db):
+    digest = uuid.uuid4().bytes
+    owner, other = _user(db), _user(db)
+
+    embedded = _document(db, other, "Resume text", digest, _vector(0))
+    db.add(DocumentChunk(document_id=embedded.id, chunk_index=0, content="Resume text", embedding=_vector(0)))
+    _document(db, other, "Resume text", digest)  # Not embedded yet
+    assert users.find_duplicate_document(db, digest, owner.id).id == embedded.id
+
+    own = _document(db, owner, "Resume text", digest)
+    duplicate = users.find_duplicate_document(db, digest, owner.id)
+    assert duplicate.id == own.id
+    assert not duplicate.embedded
+
+
+def test_copy_document_embeddings_copies_vector_and_chunks(db):
+    user = _user(db)
+    source = _document(db, user, "Resume text", embedding=_vector(1))
+    db.add_all([
+        DocumentChunk(document_id=source.id, chunk_index=index, content=f"chunk {index}", embedding=_vector(10 + index))
+        for index in range(2)
+    ])
+    target = _document(db, user, "Resume text")
+
+    users.copy_document_embeddings(db, source.id, target.id)
+    db.expire_all()
+
+    np.testing.assert_array_equal(db.get(Document, target.id).embedding, _vector(1))
+    chunks = (
+        db.query(DocumentChunk)
+        .filter(DocumentChunk.document_id == target.id)
+        .order_by(DocumentChunk.chunk_index)
+        .all()
+    )
+    assert [chunk.content for chunk in chunks] == ["chunk 0", "chunk 1"]
+    np.testing.assert_array_equal(chunks[1].embedding, _vector(11))
+
+
+def test_flush_document_embeddings_replaces_chunks_and_sets_embedding(db):
+    user = _user(db)
+    document = _document(db, user, "Resume text")
+    db.add(DocumentChunk(document_id=document.id, chunk_index=0, content="stale", embedding=_vector(0)))
+    document_id = document.id
+    db.commit()
+
+    async def flush():
+        try:
+            return await users.flush_document_embeddings([
+                users.EmbeddedDocument(document_id, _vector(2), ["first", "second"], np.stack([_vector(20), _vector(21)])),
+                # Deleted before its embeddings were stored: skipped
+                users.EmbeddedDocument(uuid.uuid4(), _vector(3), ["gone"], _vector(4)[np.newaxis]),
+            ])
+        finally:
+            # Pooled asyncpg connections belong to this event loop
+            await async_engine.dispose()
+
+    assert asyncio.run(flush()) == 1
+
+    np.testing.assert_array_equal(db.get(Document, document_id).embedding, _vector(2))
+    chunks = (
+        db.query(DocumentChunk)
+        .filter(DocumentChunk.document_id == document_id)
+        .order_by(DocumentChunk.chunk_index)
+        .all()
+    )
+    assert [(chunk.chunk_index, chunk.content) for chunk in chunks] == [(0, "first"), (1, "second")]
+    np.testing.assert_array_equal(chunks[1].embedding, _vector(21))